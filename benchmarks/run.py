@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+
+# run.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stub import create_bundle  # noqa: E402
+from benchmarks.stub import create_catalog  # noqa: E402
+from benchmarks.stub import create_document  # noqa: E402
+
+
+RESULTS_VERSION = 1
+
+GROUPS = [
+    'launch',
+    'save',
+    'metadata',
+    'suffix',
+    'monitor',
+    'snapshot',
+    'generators',
+]
+
+KiB = 1024
+MiB = 1024 * 1024
+
+
+def measure(function, repeat):
+    times = []
+    for index in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+    }
+
+
+def measure_call(function, number=10000):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    return {'per_call_us': seconds / number * 1000000}
+
+
+def start_display(kind):
+    if kind == 'existing':
+        return None
+    if kind == 'auto':
+        kind = 'xvfb' if shutil.which('Xvfb') else 'broadway'
+
+    if kind == 'xvfb':
+        read_fd, write_fd = os.pipe()
+        process = subprocess.Popen(
+            ['Xvfb', '-displayfd', str(write_fd), '-nolisten', 'tcp',
+             '-screen', '0', '1280x800x24'],
+            pass_fds=[write_fd],
+            stderr=subprocess.DEVNULL)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as display_file:
+            number = display_file.readline().strip()
+        os.environ['DISPLAY'] = ':' + number
+        os.environ['GDK_BACKEND'] = 'x11'
+        os.environ.pop('WAYLAND_DISPLAY', None)
+        return process
+
+    display = ':%d' % (10 + os.getpid() % 50)
+    process = subprocess.Popen(
+        ['broadwayd', display],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    os.environ['BROADWAY_DISPLAY'] = display
+    os.environ['GDK_BACKEND'] = 'broadway'
+    os.environ.pop('DISPLAY', None)
+    os.environ.pop('WAYLAND_DISPLAY', None)
+    return process
+
+
+def set_user_dirs(root):
+    for name in ['DATA', 'CACHE', 'CONFIG']:
+        path = os.path.join(root, name.lower())
+        os.makedirs(path, exist_ok=True)
+        os.environ['XDG_%s_HOME' % name] = path
+
+
+def read_trace(path, start):
+    with open(path, 'r') as trace_file:
+        events = json.loads(trace_file.read())['traceEvents']
+
+    result = {}
+    phases = {}
+    begins = {}
+    for event in events:
+        seconds = event['ts'] / 1000000.0
+        if event['ph'] == 'i' and event['name'] == 'first-frame':
+            result['first_frame'] = seconds - start
+        elif event['ph'] == 'i' and event['name'] == 'launch':
+            result['mode'] = event.get('args', {}).get('mode')
+        elif event['ph'] == 'B':
+            begins[(event['tid'], event['name'])] = seconds
+        elif event['ph'] == 'E':
+            begun = begins.pop((event['tid'], event['name']), None)
+            if begun is not None:
+                phases[event['name']] = seconds - begun
+    result['phases'] = phases
+    return result
+
+
+def launch(bundle_path, root, env):
+    trace_path = os.path.join(root, 'trace.json')
+    if os.path.exists(trace_path):
+        os.unlink(trace_path)
+
+    env = dict(env)
+    env['SUGAR_BUNDLE_PATH'] = bundle_path
+    env['SUGARAPP_TRACE'] = trace_path
+    env['SUGARAPP_BENCH_QUIT'] = '1'
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+
+    start = time.monotonic()
+    env['SUGARAPP_LAUNCH_TIME'] = repr(start)
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'bin', 'sugarapp')],
+        env=env,
+        timeout=120,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        check=True)
+    return read_trace(trace_path, start)
+
+
+def summarize_launches(launches):
+    result = {
+        'first_frame': measure_values(
+            [launch['first_frame'] for launch in launches]),
+        'phases': {},
+    }
+    names = set()
+    for launch in launches:
+        names.update(launch['phases'])
+    for name in sorted(names):
+        result['phases'][name] = statistics.median(
+            [launch['phases'].get(name, 0) for launch in launches])
+    return result
+
+
+def measure_values(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'mean': statistics.mean(values),
+    }
+
+
+def bench_launch(root, repeat):
+    bundle_path = create_bundle(os.path.join(root, 'launch'), icons=300)
+    results = {}
+
+    # cold: every launch starts with empty user data and cache dirs
+    launches = []
+    for index in range(repeat):
+        user_root = tempfile.mkdtemp(dir=root)
+        env = dict(os.environ)
+        for name in ['DATA', 'CACHE', 'CONFIG']:
+            env['XDG_%s_HOME' % name] = os.path.join(user_root, name.lower())
+        env['SUGARAPP_ZYGOTE_SOCKET'] = os.path.join(root, 'no-zygote')
+        launches.append(launch(bundle_path, root, env))
+    results['cold'] = summarize_launches(launches)
+
+    env = dict(os.environ)
+    env['SUGARAPP_ZYGOTE_SOCKET'] = os.path.join(root, 'no-zygote')
+
+    def warm(bundle_path):
+        launch(bundle_path, root, env)
+        return summarize_launches(
+            [launch(bundle_path, root, env) for index in range(repeat)])
+
+    results['warm'] = warm(bundle_path)
+
+    bytecode_path = shutil.copytree(
+        bundle_path, os.path.join(root, 'bytecode', 'Stub.activity'))
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'utils', 'sugarapp-gen-bytecode'),
+         bytecode_path],
+        env=dict(os.environ, PYTHONPATH=ROOT),
+        check=True)
+    results['bytecode'] = warm(bytecode_path)
+
+    if shutil.which('glib-compile-resources'):
+        resources_path = shutil.copytree(
+            bundle_path, os.path.join(root, 'resources', 'Stub.activity'))
+        subprocess.run(
+            [sys.executable,
+             os.path.join(ROOT, 'utils', 'sugarapp-gen-resources'),
+             resources_path],
+            env=dict(os.environ, PYTHONPATH=ROOT),
+            check=True)
+        results['resources'] = warm(resources_path)
+    else:
+        results['resources'] = {
+            'skipped': 'glib-compile-resources is not available'}
+
+    # the same large document restored on the main thread and on a worker,
+    # closing only once it is loaded
+    document_path = os.path.join(os.environ['XDG_DATA_HOME'], 'autosave')
+    for name, class_name in [('restore', 'StubActivity'),
+                             ('restore_async', 'AsyncStubActivity')]:
+        create_document(document_path, 8 * MiB)
+        restore_path = create_bundle(
+            os.path.join(root, name), class_name=class_name)
+        results[name] = warm(restore_path)
+    os.unlink(document_path)
+    results['restore_async']['speedup'] = \
+        results['restore']['first_frame']['median'] / \
+        results['restore_async']['first_frame']['median']
+
+    socket_path = os.path.join(root, 'zygote')
+    zygote_env = dict(os.environ)
+    zygote_env['SUGARAPP_ZYGOTE_SOCKET'] = socket_path
+    zygote_env['PYTHONPATH'] = ROOT
+    zygote = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'bin', 'sugarapp-zygote')],
+        env=zygote_env,
+        stderr=subprocess.DEVNULL)
+    try:
+        for index in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        env = dict(os.environ, SUGARAPP_ZYGOTE_SOCKET=socket_path)
+        # the launcher silently falls back to a direct launch
+        if launch(bundle_path, root, env).get('mode') != 'zygote':
+            results['zygote'] = {'skipped': 'the zygote did not start'}
+        else:
+            results['zygote'] = warm(bundle_path)
+            results['zygote']['speedup'] = \
+                results['warm']['first_frame']['median'] / \
+                results['zygote']['first_frame']['median']
+    finally:
+        zygote.send_signal(signal.SIGTERM)
+        zygote.wait()
+
+    return results
+
+
+def create_activity(root):
+    bundle_path = create_bundle(os.path.join(root, 'runtime'))
+    os.environ['SUGAR_BUNDLE_PATH'] = bundle_path
+    os.environ['SUGAR_BUNDLE_ID'] = 'org.sugarlabs.Stub'
+    os.environ['SUGAR_BUNDLE_NAME'] = 'Stub'
+    os.environ['SUGAR_BUNDLE_VERSION'] = '1'
+    os.environ['SUGAR_ACTIVITY_ROOT'] = os.environ['XDG_DATA_HOME']
+    sys.path.insert(0, bundle_path)
+
+    import gi
+    gi.require_version('Gtk', '3.0')
+
+    from sugar3.activity.activityhandle import ActivityHandle
+    from stubactivity import StubActivity
+
+    return StubActivity(ActivityHandle(activity_id='org.sugarlabs.Stub'))
+
+
+def bench_save(activity, repeat):
+    results = {}
+    for size in [KiB, MiB, 16 * MiB]:
+        activity.data = os.urandom(size)
+        timing = measure(activity.save, repeat)
+        timing['mb_per_s'] = size / MiB / timing['median']
+        results['%d' % size] = timing
+    return results
+
+
+def bench_metadata(activity, repeat):
+    results = {}
+    for size in [KiB, 64 * KiB, MiB]:
+        activity.metadata['preview'] = 'x' * size
+        save = measure(activity._save_metadata, repeat)
+        restore = measure(activity._restore_metadata, repeat)
+        save['mb_per_s'] = size / MiB / save['median']
+        restore['mb_per_s'] = size / MiB / restore['median']
+        results['%d' % size] = {'save': save, 'restore': restore}
+    return results
+
+
+def bench_suffix(activity):
+    from sugarapp import bundlecache
+
+    path = os.path.join(
+        activity._get_bundle_path(), 'activity', 'mimetypes.xml')
+
+    def uncached():
+        bundlecache._mimetypes.clear()
+        bundlecache.get_filename_suffix(path)
+
+    return {
+        'cached': measure_call(
+            lambda: bundlecache.get_filename_suffix(path)),
+        'uncached': measure_call(uncached, number=1000),
+        'activity': measure_call(activity.get_filename_suffix),
+    }
+
+
+def bench_monitor():
+    from sugarapp.helpers import PrimaryMonitor
+
+    return {
+        'width': measure_call(PrimaryMonitor.width),
+        'height': measure_call(PrimaryMonitor.height),
+        'geometry': measure_call(PrimaryMonitor.get_geometry),
+        'workarea': measure_call(PrimaryMonitor.get_workarea),
+        'scale_factor': measure_call(PrimaryMonitor.get_scale_factor),
+    }
+
+
+def bench_snapshot(root):
+    from sugarapp.autosave import SnapshotStore
+
+    size = 8 * MiB
+    data = bytearray(os.urandom(size))
+    document_path = os.path.join(root, 'document')
+    store = SnapshotStore(os.path.join(root, 'snapshots'))
+
+    def add():
+        with open(document_path, 'wb') as document:
+            document.write(data)
+        return store.add(document_path)[1]
+
+    first = add()
+    data[size // 2] ^= 0xff
+    changed = add()
+    unchanged = add()
+    return {
+        'document_bytes': size,
+        'first_bytes': first,
+        'one_byte_change_bytes': changed,
+        'unchanged_bytes': unchanged,
+        'one_byte_change_ratio': changed / size,
+    }
+
+
+def bench_generators(root, catalog_size, jobs):
+    from sugarapp.generators import generate_catalog
+    from sugarapp.validation import validate_catalog
+
+    bundle_paths = create_catalog(os.path.join(root, 'catalog'), catalog_size)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    results = {'bundles': catalog_size}
+
+    def scripts():
+        output = os.path.join(root, 'scripts')
+        os.makedirs(output, exist_ok=True)
+        for bundle_path in bundle_paths:
+            info = os.path.join(bundle_path, 'activity', 'activity.info')
+            name = os.path.basename(bundle_path)
+            mimetypes = os.path.join(output, name + '.xml')
+            for command in [
+                    ['sugarapp-gen-mimetypes', info, mimetypes],
+                    ['sugarapp-gen-appdata', info,
+                     os.path.join(output, name + '.appdata.xml')],
+                    ['sugarapp-gen-desktop', info,
+                     os.path.join(output, name + '.desktop'),
+                     '--mimetypes', mimetypes]]:
+                command[0] = os.path.join(ROOT, 'utils', command[0])
+                subprocess.run(
+                    [sys.executable] + command, env=env, check=True)
+
+    output = os.path.join(root, 'metadata')
+    timings = [
+        ('scripts', scripts),
+        ('catalog_serial',
+         lambda: generate_catalog(bundle_paths, output, 1)),
+        ('catalog_parallel',
+         lambda: generate_catalog(bundle_paths, output, jobs)),
+        ('catalog_incremental',
+         lambda: generate_catalog(bundle_paths, output, jobs, True)),
+        ('catalog_incremental_noop',
+         lambda: generate_catalog(bundle_paths, output, jobs, True)),
+        ('validate', lambda: validate_catalog(output, jobs)),
+    ]
+    for name, function in timings:
+        timing = measure(function, 1)
+        timing['bundles_per_s'] = catalog_size / timing['median']
+        results[name] = timing
+    return results
+
+
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(previous, current):
+    previous = flatten(previous['results'])
+    current = flatten(current['results'])
+    for name in sorted(current):
+        if name not in previous:
+            continue
+        old, new = previous[name], current[name]
+        change = ''
+        if old:
+            change = '%+.1f%%' % ((new - old) / old * 100)
+        print('%-60s %14.6g %14.6g %9s' % (name, old, new, change))
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, root):
+    selected = args.only or GROUPS
+    results = {}
+
+    if 'snapshot' in selected:
+        results['snapshot'] = bench_snapshot(root)
+    if 'generators' in selected:
+        results['generators'] = bench_generators(
+            root, args.catalog_size, args.jobs)
+
+    runtime = [group for group in selected
+               if group in ['launch', 'save', 'metadata', 'suffix', 'monitor']]
+    if not runtime:
+        return results
+
+    try:
+        display = start_display(args.display)
+    except OSError as e:
+        for group in runtime:
+            results[group] = {'skipped': 'no display: %s' % e}
+        return results
+
+    try:
+        if 'launch' in runtime:
+            try:
+                results['launch'] = bench_launch(root, args.repeat)
+            except (OSError, subprocess.SubprocessError) as e:
+                results['launch'] = {'skipped': str(e)}
+
+        try:
+            activity = create_activity(root)
+        except Exception as e:
+            for group in runtime:
+                results.setdefault(group, {'skipped': str(e)})
+            return results
+
+        if 'save' in runtime:
+            results['save'] = bench_save(activity, args.repeat)
+        if 'metadata' in runtime:
+            results['metadata'] = bench_metadata(activity, args.repeat)
+        if 'suffix' in runtime:
+            results['suffix'] = bench_suffix(activity)
+        if 'monitor' in runtime:
+            results['monitor'] = bench_monitor()
+        activity.destroy()
+    finally:
+        if display is not None:
+            display.terminate()
+            display.wait()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--output',
+        type=str,
+        default='benchmark.json',
+        help='path to the JSON results to be written')
+    parser.add_argument(
+        '--compare',
+        type=str,
+        default=None,
+        help='path to previous JSON results to compare with')
+    parser.add_argument(
+        '--only',
+        type=str,
+        action='append',
+        choices=GROUPS,
+        help='benchmark group to run, can be given more than once')
+    parser.add_argument(
+        '--display',
+        type=str,
+        default='auto',
+        choices=['auto', 'xvfb', 'broadway', 'existing'],
+        help='display server used by the runtime benchmarks')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='number of runs of each measurement')
+    parser.add_argument(
+        '--catalog-size',
+        type=int,
+        default=100,
+        help='number of bundles in the generated catalog')
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='number of parallel processes for the catalog generators')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='sugarapp-bench-')
+    set_user_dirs(root)
+    try:
+        results = {
+            'version': RESULTS_VERSION,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': get_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': run(args, root),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as previous_file:
+            compare(json.loads(previous_file.read()), results)
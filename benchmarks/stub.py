@@ -0,0 +1,168 @@
+# stub.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Synthetic activity bundles for the benchmarks. This module must not
+# depend on gi, the generator benchmarks run without it.
+
+import json
+import os
+
+from sugarapp.generators import ActivityInfo
+from sugarapp.generators import generate_mimetypes
+from sugarapp.generators import get_info_path
+
+
+ACTIVITY_INFO = """[Activity]
+name = {name}
+activity_version = 1
+bundle_id = org.sugarlabs.{name}
+exec = sugar-activity3 stubactivity.{class_name}
+icon = activity-stub
+license = GPLv3+
+metadata_license = CC0-1.0
+summary = Stub activity used by the sugarapp benchmarks
+description = Does nothing, quickly.
+tags = Utility
+update_contact = bench@sugarlabs.org
+release_date = 2019-01-01
+developer_name = Sugar Labs
+developer_id = org.sugarlabs
+url = https://github.com/tchx84/sugarapp
+repository_url = https://github.com/tchx84/sugarapp
+"""
+
+ICON = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" \
+"http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd" [
+  <!ENTITY stroke_color "#010101">
+  <!ENTITY fill_color "#FFFFFF">
+]>
+<svg xmlns="http://www.w3.org/2000/svg" width="55" height="55">
+  <rect x="{offset}" y="{offset}" width="40" height="40"
+        style="fill:&fill_color;;stroke:&stroke_color;;stroke-width:3"/>
+</svg>
+"""
+
+ACTIVITY = """import json
+import os
+
+from gi.repository import GLib
+from gi.repository import Gtk
+
+from sugar3.graphics.toolbarbox import ToolbarBox
+
+from sugarapp.widgets import ExtendedActivityToolbarButton
+from sugarapp.widgets import SugarCompatibleActivity
+
+
+def parse(file_path):
+    with open(file_path, 'rb') as document:
+        data = document.read()
+    return data, json.loads(data.decode('utf-8'))
+
+
+class StubActivity(SugarCompatibleActivity):
+
+    def __init__(self, handle):
+        SugarCompatibleActivity.__init__(self, handle)
+        self.data = b''
+        self.document = None
+        self._mapped = False
+        self._restored = True
+
+        toolbar_box = ToolbarBox()
+        toolbar_box.toolbar.insert(ExtendedActivityToolbarButton(self), -1)
+        self.set_toolbar_box(toolbar_box)
+        toolbar_box.show_all()
+
+        canvas = Gtk.Label(label='stub')
+        self.set_canvas(canvas)
+        canvas.show()
+
+        if 'SUGARAPP_BENCH_QUIT' in os.environ:
+            self.connect('map-event', self.__map_event_cb)
+
+    def __map_event_cb(self, widget, event):
+        self._mapped = True
+        self._quit_when_ready()
+        return False
+
+    def _quit_when_ready(self):
+        if self._mapped and self._restored:
+            GLib.idle_add(self.close)
+
+    def read_file(self, file_path):
+        self.data, self.document = parse(file_path)
+
+    def write_file(self, file_path):
+        with open(file_path, 'wb') as document:
+            document.write(self.data)
+
+
+class AsyncStubActivity(StubActivity):
+
+    def __init__(self, handle):
+        StubActivity.__init__(self, handle)
+        self._restored = False
+
+    def parse_file(self, file_path):
+        return parse(file_path)
+
+    def read_data(self, data):
+        self.data, self.document = data
+        self._restored = True
+        self._quit_when_ready()
+"""
+
+
+def create_bundle(root, name='Stub', icons=0, class_name='StubActivity'):
+    bundle_path = os.path.join(root, '%s.activity' % name)
+    os.makedirs(os.path.join(bundle_path, 'activity'), exist_ok=True)
+    os.makedirs(os.path.join(bundle_path, 'icons'), exist_ok=True)
+
+    info_path = get_info_path(bundle_path)
+    with open(info_path, 'w') as info_file:
+        info_file.write(ACTIVITY_INFO.format(
+            name=name, class_name=class_name))
+    mimetypes_path = os.path.join(bundle_path, 'activity', 'mimetypes.xml')
+    with open(mimetypes_path, 'w') as mimetypes_file:
+        mimetypes_file.write(generate_mimetypes(ActivityInfo(info_path)))
+
+    icon_path = os.path.join(bundle_path, 'activity', 'activity-stub.svg')
+    with open(icon_path, 'w') as icon_file:
+        icon_file.write(ICON.format(offset=7))
+    for index in range(icons):
+        icon_path = os.path.join(bundle_path, 'icons', 'stub-%d.svg' % index)
+        with open(icon_path, 'w') as icon_file:
+            icon_file.write(ICON.format(offset=index % 15))
+
+    with open(os.path.join(bundle_path, 'stubactivity.py'), 'w') as source:
+        source.write(ACTIVITY)
+    return bundle_path
+
+
+def create_document(path, size):
+    # many small values, so that parsing it costs more than reading it
+    values = list(range(size // 8))
+    with open(path, 'w') as document:
+        document.write(json.dumps({'values': values}))
+
+
+def create_catalog(root, count):
+    return [create_bundle(root, 'Stub%d' % index) for index in range(count)]
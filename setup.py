@@ -51,9 +51,16 @@ setup(name='sugarapp',
       zip_safe=False,
       scripts=[
           'bin/sugarapp',
+          'bin/sugarapp-zygote',
+          'utils/sugarapp-gen',
           'utils/sugarapp-gen-appdata',
+          'utils/sugarapp-gen-bytecode',
           'utils/sugarapp-gen-desktop',
-          'utils/sugarapp-gen-mimetypes'],
+          'utils/sugarapp-gen-icons',
+          'utils/sugarapp-gen-mimetypes',
+          'utils/sugarapp-gen-resources',
+          'utils/sugarapp-registry',
+          'utils/sugarapp-validate'],
       cmdclass={
           'install': CheckRequirementsAndInstall,
       })
@@ -19,9 +19,11 @@
 
 import gettext
 import gi
+import hashlib
 import logging
 import os
 import sys
+import time
 
 gi.require_version('Gtk', '3.0')
 
@@ -32,17 +34,31 @@ from gi.repository import Gtk
 from sugar3 import config
 from sugar3 import logger
 from sugar3.activity.activityhandle import ActivityHandle
-from sugar3.bundle.activitybundle import ActivityBundle
 from sugar3.bundle.bundle import MalformedBundleException
 
+from . import importer
+from . import logs
+from . import tracing
+from .profiling import Profiler
+from .profiling import StallWatchdog
+from .registry import Registry
+from .bundlecache import get_bundle_info
 
-logger.start()
 
 _logger = logging.getLogger()
 
 
 class Application(Gtk.Application):
     def __init__(self):
+        # the launch time only applies to this process, keep it away from
+        # anything spawned later
+        self._launch_time = os.environ.pop('SUGARAPP_LAUNCH_TIME', None)
+        self._launch_mode = os.environ.pop('SUGARAPP_LAUNCH_MODE', 'direct')
+        if self._launch_time is not None:
+            self._launch_time = float(self._launch_time)
+            tracing.mark(
+                'launch', self._launch_time, {'mode': self._launch_mode})
+        tracing.mark('application-init')
         if 'SUGAR_BUNDLE_ID' not in os.environ:
             _logger.error("SUGAR_BUNDLE_ID must be set to run application")
             sys.exit(1)
@@ -51,44 +67,221 @@ class Application(Gtk.Application):
             application_id=os.environ['SUGAR_BUNDLE_ID'],
             flags=Gio.ApplicationFlags.HANDLES_OPEN)
         self._activity = None
+        self._activities = []
         self._path = None
+        self._bundle = None
+        self._constructor = None
+        self._multi_document = 'SUGARAPP_MULTI_DOCUMENT' in os.environ
+        self._open_queue = []
+        self._open_source_id = None
+        self._watchdog = None
+        self._profiler = None
+        self._registry = None
+
+    def run(self, argv):
+        if 'SUGARAPP_LOG' in os.environ:
+            logs.start(
+                os.environ['SUGARAPP_LOG'],
+                max_bytes=int(os.environ.get(
+                    'SUGARAPP_LOG_MAX_SIZE', 1024 * 1024)),
+                capacity=int(os.environ.get('SUGARAPP_LOG_BUFFER', 1000)))
+        else:
+            logger.start()
+        if 'SUGARAPP_WATCHDOG' in os.environ:
+            threshold = float(os.environ['SUGARAPP_WATCHDOG']) / 1000
+            self._watchdog = StallWatchdog(threshold)
+            self._watchdog.start()
+        if 'SUGARAPP_PROFILE' in os.environ or \
+                'SUGARAPP_TRACEMALLOC' in os.environ:
+            self._profiler = Profiler(
+                profile='SUGARAPP_PROFILE' in os.environ,
+                memory='SUGARAPP_TRACEMALLOC' in os.environ)
+            self._profiler.start()
+        return Gtk.Application.run(self, argv)
 
     def do_activate(self):
         if self._activity is None:
-            self._activity = self._setup_activity()
+            with tracing.phase('setup-activity'):
+                self._activity = self._setup_activity()
+            self._activity.connect('map-event', self.__map_event_cb)
             self.add_window(self._activity)
         self._activity.present()
 
     def do_open(self, files, hint, data):
+        files = self._route_files(files)
+        if not files:
+            return
+        if self._multi_document:
+            self._queue_files(files)
+            return
         self._path = files[0].get_path()
         if self._activity is None:
             self.do_activate()
         else:
-            self._activity.read_file(self._path)
+            self._activity.restore_file(self._path)
 
     def do_shutdown(self):
-        if self._activity is not None:
-            self._activity.close()
+        try:
+            if self._open_source_id is not None:
+                GLib.source_remove(self._open_source_id)
+                self._open_source_id = None
+            for activity in list(self._activities):
+                activity.close()
+            self._activities = []
             self._activity = None
-        Gtk.Application.do_shutdown(self)
+            if self._watchdog is not None:
+                self._watchdog.stop()
+            if self._profiler is not None:
+                self._profiler.stop(GLib.get_user_data_dir())
+            tracing.write()
+            if 'SUGARAPP_IMPORT_REPORT' in os.environ:
+                importer.write_report(os.environ['SUGARAPP_IMPORT_REPORT'])
+        finally:
+            logs.stop()
+            Gtk.Application.do_shutdown(self)
+
+    def _get_registry(self):
+        if self._registry is None and 'SUGARAPP_REGISTRY' in os.environ:
+            try:
+                self._registry = Registry.load(os.environ['SUGARAPP_REGISTRY'])
+            except (OSError, ValueError) as e:
+                _logger.error('could not load registry: %s', e)
+        return self._registry
+
+    def _route_files(self, files):
+        registry = self._get_registry()
+        if registry is None:
+            return files
+
+        # files this bundle declares stay here, even when other bundles
+        # handle them too
+        own_id = self.get_application_id()
+        own_files = []
+        for gfile in files:
+            name = gfile.get_basename()
+            bundle = registry.lookup_filename(name, own_id)
+            if bundle is None or bundle[0] != own_id:
+                content_type, uncertain = Gio.content_type_guess(name, None)
+                by_type = registry.lookup_mimetype(content_type, own_id)
+                if bundle is None or \
+                        (by_type is not None and by_type[0] == own_id):
+                    bundle = by_type
+            if bundle is None or bundle[0] == own_id:
+                own_files.append(gfile)
+                continue
+            self._open_with_bundle(bundle, gfile)
+        return own_files
+
+    def _open_with_bundle(self, bundle, gfile):
+        bundle_id, bundle_path = bundle
+        environ = dict(os.environ)
+        environ['SUGAR_BUNDLE_ID'] = bundle_id
+        environ['SUGAR_BUNDLE_PATH'] = bundle_path
+        for name in ['SUGARAPP_LAUNCH_TIME', 'SUGARAPP_LAUNCH_MODE']:
+            environ.pop(name, None)
+        envp = ['%s=%s' % item for item in environ.items()]
+        try:
+            GLib.spawn_async(
+                ['sugarapp', gfile.get_path()], envp=envp,
+                flags=GLib.SpawnFlags.SEARCH_PATH)
+        except GLib.Error as e:
+            _logger.error('could not open %s with %s: %s',
+                          gfile.get_path(), bundle_id, e)
+
+    def __map_event_cb(self, activity, event):
+        activity.disconnect_by_func(self.__map_event_cb)
+        tracing.mark('first-frame')
+        if self._launch_time is None:
+            return False
+        elapsed = time.monotonic() - self._launch_time
+        _logger.info('time to first window: %.3fs (%s)', elapsed,
+                     self._launch_mode)
+        return False
+
+    def _queue_files(self, files):
+        if self._activity is None:
+            self._path = files[0].get_path()
+            files = files[1:]
+            self.do_activate()
+        self._open_queue.extend(gfile.get_path() for gfile in files)
+        if self._open_queue and self._open_source_id is None:
+            self._open_source_id = GLib.idle_add(self.__open_queue_cb)
+
+    def __open_queue_cb(self):
+        path = self._open_queue.pop(0)
+        activity_id = self._get_document_id(path)
+        activity = self._get_activity(activity_id)
+        if activity is None:
+            with tracing.phase('open-window', {'path': path}):
+                activity = self._create_activity(path, activity_id)
+            self.add_window(activity)
+        activity.present()
+        if self._open_queue:
+            return True
+        self._open_source_id = None
+        return False
+
+    def _get_document_id(self, path):
+        # the id names the autosave files, so it must identify the document
+        # across sessions
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8'))
+        return '%s-%s' % (self._bundle.bundle_id, digest.hexdigest()[:16])
+
+    def _get_activity(self, activity_id):
+        for activity in self._activities:
+            if activity.get_id() == activity_id:
+                return activity
+        return None
 
     def _quit(self, activity):
-        self._activity = None
-        self.quit()
+        if activity in self._activities:
+            self._activities.remove(activity)
+        if activity is self._activity:
+            self._activity = None
+            if self._activities:
+                self._activity = self._activities[0]
+        if not self._activities:
+            self.quit()
+            return
+        self.remove_window(activity)
+        activity.destroy()
 
     def _setup_activity(self):
+        if self._constructor is None:
+            self._load_bundle()
+        activity_id = self._bundle.bundle_id
+        if self._multi_document and self._path is not None:
+            activity_id = self._get_document_id(self._path)
+        return self._create_activity(self._path, activity_id)
+
+    def _create_activity(self, path, activity_id):
+        handle = ActivityHandle(
+            activity_id=activity_id,
+            uri=path)
+
+        with tracing.phase('construct-activity'):
+            activity = self._constructor(handle)
+        activity.connect('closing', self._quit)
+        activity.show()
+        self._activities.append(activity)
+        return activity
+
+    def _load_bundle(self):
         if 'SUGAR_BUNDLE_PATH' not in os.environ:
             _logger.error("SUGAR_BUNDLE_PATH must be set to run application")
             sys.exit(1)
 
         bundle_path = os.environ['SUGAR_BUNDLE_PATH']
-        sys.path.insert(0, bundle_path)
+        with tracing.phase('install-importer'):
+            if not importer.install(bundle_path):
+                sys.path.insert(0, bundle_path)
 
-        try:
-            bundle = ActivityBundle(bundle_path)
-        except MalformedBundleException as e:
-            _logger.error(e)
-            sys.exit(1)
+        with tracing.phase('bundle-parse'):
+            try:
+                bundle = get_bundle_info(bundle_path)
+            except MalformedBundleException as e:
+                _logger.error(e)
+                sys.exit(1)
 
         activity_root = GLib.get_user_data_dir()
 
@@ -97,43 +290,37 @@ class Application(Gtk.Application):
             os.path.join(activity_root, 'data'),
             os.path.join(activity_root, 'instance'),
         ]
-        for subdir in subdirs:
-            try:
-                os.makedirs(subdir)
-            except:
-                pass
+        with tracing.phase('create-dirs'):
+            for subdir in subdirs:
+                try:
+                    os.makedirs(subdir)
+                except:
+                    pass
 
-        os.environ['SUGAR_BUNDLE_ID'] = bundle.get_bundle_id()
+        os.environ['SUGAR_BUNDLE_ID'] = bundle.bundle_id
         os.environ['SUGAR_ACTIVITY_ROOT'] = activity_root
-        os.environ['SUGAR_BUNDLE_NAME'] = bundle.get_name()
-        os.environ['SUGAR_BUNDLE_VERSION'] = str(bundle.get_activity_version())
+        os.environ['SUGAR_BUNDLE_NAME'] = bundle.name
+        os.environ['SUGAR_BUNDLE_VERSION'] = bundle.version
 
-        locale_path = config.locale_path
-        gettext.bindtextdomain(bundle.get_bundle_id(), locale_path)
-        gettext.bindtextdomain('sugar-toolkit-gtk3', config.locale_path)
-        gettext.textdomain(bundle.get_bundle_id())
+        with tracing.phase('bind-textdomain'):
+            locale_path = config.locale_path
+            gettext.bindtextdomain(bundle.bundle_id, locale_path)
+            gettext.bindtextdomain('sugar-toolkit-gtk3', config.locale_path)
+            gettext.textdomain(bundle.bundle_id)
 
-        activity_class = bundle.get_command().split(" ")[1]
-        splitted_module = activity_class.rsplit('.', 1)
-        module_name = splitted_module[0]
-        class_name = splitted_module[1]
+        module_name = bundle.module_name
+        class_name = bundle.class_name
 
-        module = __import__(module_name)
-        for component in module_name.split('.')[1:]:
-            module = getattr(module, component)
+        with tracing.phase('import-activity', {'module': module_name}):
+            module = __import__(module_name)
+            for component in module_name.split('.')[1:]:
+                module = getattr(module, component)
 
-        constructor = getattr(module, class_name)
-        handle = ActivityHandle(
-            activity_id=bundle.get_bundle_id(),
-            uri=self._path)
+        self._constructor = getattr(module, class_name)
+        self._bundle = bundle
 
         os.chdir(bundle_path)
 
-        activity = constructor(handle)
-        activity.connect('closing', self._quit)
-        activity.show()
-        return activity
-
 
 def main():
     app = Application()
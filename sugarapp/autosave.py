@@ -0,0 +1,148 @@
+# autosave.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import time
+import zlib
+
+from .fileutils import discard_file
+from .fileutils import get_temp_path
+from .fileutils import write_file
+
+
+class SnapshotStore(object):
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, root, max_versions=5):
+        self._root = root
+        self._max_versions = max_versions
+        self._chunks_path = os.path.join(root, 'chunks')
+        self._versions_path = os.path.join(root, 'versions')
+        os.makedirs(self._chunks_path, exist_ok=True)
+        os.makedirs(self._versions_path, exist_ok=True)
+
+    def get_versions(self):
+        versions = []
+        for name in os.listdir(self._versions_path):
+            if name.endswith('.json'):
+                versions.append(name[:-len('.json')])
+        return sorted(versions)
+
+    def get_latest(self):
+        versions = self.get_versions()
+        if not versions:
+            return None
+        return versions[-1]
+
+    @contextlib.contextmanager
+    def _lock(self, operation=fcntl.LOCK_EX):
+        # Eviction removes chunks that add may have just found and reused,
+        # so both run under a lock shared by every thread and process
+        # using this store.
+        with open(os.path.join(self._root, 'lock'), 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def add(self, file_path):
+        with self._lock():
+            return self._add(file_path)
+
+    def _add(self, file_path):
+        chunks = []
+        size = 0
+        written = 0
+        with open(file_path, 'rb') as data_file:
+            while True:
+                data = data_file.read(self.CHUNK_SIZE)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                written += self._store_chunk(digest, data)
+                chunks.append(digest)
+                size += len(data)
+
+        manifest = json.dumps({'size': size, 'chunks': chunks})
+        version = '%020d' % time.time_ns()
+        write_file(self._get_version_path(version), manifest)
+        written += len(manifest)
+
+        self._evict()
+        return version, written
+
+    def restore(self, version, file_path):
+        with self._lock(fcntl.LOCK_SH):
+            self._restore(version, file_path)
+
+    def _restore(self, version, file_path):
+        with open(self._get_version_path(version), 'r') as manifest_file:
+            manifest = json.loads(manifest_file.read())
+
+        temp_path = get_temp_path(file_path)
+        with open(temp_path, 'wb') as data_file:
+            for digest in manifest['chunks']:
+                with open(self._get_chunk_path(digest), 'rb') as chunk_file:
+                    data = zlib.decompress(chunk_file.read())
+                if hashlib.sha256(data).hexdigest() != digest:
+                    discard_file(temp_path)
+                    raise ValueError('corrupted chunk %s' % digest)
+                data_file.write(data)
+        os.replace(temp_path, file_path)
+
+    def _store_chunk(self, digest, data):
+        path = self._get_chunk_path(digest)
+        if os.path.exists(path):
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data)
+        write_file(path, compressed)
+        return len(compressed)
+
+    def _evict(self):
+        versions = self.get_versions()
+        expired = versions[:max(0, len(versions) - self._max_versions)]
+        if not expired:
+            return
+
+        for version in expired:
+            discard_file(self._get_version_path(version))
+
+        referenced = set()
+        for version in self.get_versions():
+            with open(self._get_version_path(version), 'r') as manifest_file:
+                referenced.update(json.loads(manifest_file.read())['chunks'])
+
+        for prefix in os.listdir(self._chunks_path):
+            prefix_path = os.path.join(self._chunks_path, prefix)
+            for digest in os.listdir(prefix_path):
+                if digest not in referenced:
+                    discard_file(os.path.join(prefix_path, digest))
+
+    def _get_chunk_path(self, digest):
+        return os.path.join(self._chunks_path, digest[:2], digest)
+
+    def _get_version_path(self, version):
+        return os.path.join(self._versions_path, version + '.json')
@@ -0,0 +1,181 @@
+# bundlecache.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import json
+import logging
+import os
+
+from xml.etree import ElementTree as ET
+
+from gi.repository import GLib
+
+from sugar3.bundle.activitybundle import ActivityBundle
+
+from .fileutils import write_file
+
+
+_logger = logging.getLogger()
+
+_CACHE_VERSION = 2
+_XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+_memory = {}
+_mimetypes = {}
+
+
+class BundleInfo(object):
+
+    def __init__(self, entry):
+        self.bundle_id = entry['bundle_id']
+        self.name = entry['name']
+        self.version = entry['version']
+        self.icon = entry['icon']
+        self.module_name = entry['module_name']
+        self.class_name = entry['class_name']
+
+
+def get_bundle_info(bundle_path):
+    bundle_path = os.path.abspath(bundle_path)
+    key = _get_key(bundle_path)
+
+    entry = _memory.get(bundle_path)
+    if entry is None or entry['key'] != key:
+        cache = _load_cache()
+        entry = cache.get(bundle_path)
+        if entry is None or entry.get('key') != key:
+            entry = _parse_bundle(bundle_path)
+            entry['key'] = key
+            cache[bundle_path] = entry
+            _store_cache(cache)
+        _memory[bundle_path] = entry
+
+    return BundleInfo(entry)
+
+
+class MimeTypes(object):
+
+    def __init__(self, types):
+        self.types = types
+
+    def get_suffix(self):
+        globs = self.get_globs()
+        if not globs:
+            return ''
+        return globs[0].replace('*', '')
+
+    def get_globs(self):
+        return [pattern
+                for mime_type in self.types
+                for pattern in mime_type['globs']]
+
+
+def get_mimetypes(mimetypes_path):
+    try:
+        stat = os.stat(mimetypes_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        key = None
+
+    cached = _mimetypes.get(mimetypes_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    mimetypes = MimeTypes([])
+    if key is not None:
+        mimetypes = _parse_mimetypes(mimetypes_path)
+    _mimetypes[mimetypes_path] = (key, mimetypes)
+    return mimetypes
+
+
+def get_filename_suffix(mimetypes_path):
+    return get_mimetypes(mimetypes_path).get_suffix()
+
+
+def _iter_tag(element, name):
+    for child in element.iter():
+        if child.tag.rsplit('}', 1)[-1] == name:
+            yield child
+
+
+def _parse_mimetypes(mimetypes_path):
+    types = []
+    root = ET.parse(mimetypes_path).getroot()
+    for element in _iter_tag(root, 'mime-type'):
+        comment = None
+        for comment_element in _iter_tag(element, 'comment'):
+            lang = comment_element.get(_XML_LANG)
+            if comment is None or lang in [None, 'en']:
+                comment = comment_element.text
+        types.append({
+            'type': element.get('type'),
+            'comment': comment,
+            'globs': [glob.get('pattern')
+                      for glob in _iter_tag(element, 'glob')],
+        })
+    return MimeTypes(types)
+
+
+def _get_cache_path():
+    return GLib.build_filenamev([GLib.get_user_data_dir(), 'bundles.json'])
+
+
+def _get_key(bundle_path):
+    key = [_CACHE_VERSION]
+    for name in ['activity.info', 'mimetypes.xml']:
+        try:
+            stat = os.stat(os.path.join(bundle_path, 'activity', name))
+            key.append([stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            key.append(None)
+    return key
+
+
+def _parse_bundle(bundle_path):
+    bundle = ActivityBundle(bundle_path)
+
+    activity_class = bundle.get_command().split(" ")[1]
+    module_name, class_name = activity_class.rsplit('.', 1)
+
+    return {
+        'bundle_id': bundle.get_bundle_id(),
+        'name': bundle.get_name(),
+        'version': str(bundle.get_activity_version()),
+        'icon': bundle.get_icon(),
+        'module_name': module_name,
+        'class_name': class_name,
+    }
+
+
+def _load_cache():
+    try:
+        with open(_get_cache_path(), 'r') as cache_file:
+            cache = json.loads(cache_file.read())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+
+def _store_cache(cache):
+    path = _get_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file(path, json.dumps(cache))
+    except OSError as e:
+        _logger.warning('could not store bundle cache: %s', e)
@@ -0,0 +1,65 @@
+# fileutils.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Atomic file writes shared by the runtime and the build time tools, so
+# it must not depend on gi.
+
+import os
+
+
+def get_temp_path(path):
+    return '%s.%d.tmp' % (path, os.getpid())
+
+
+def commit_file(temp_path, path):
+    with open(temp_path, 'rb') as temp_file:
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+    _sync_dir(os.path.dirname(path))
+
+
+def write_file(path, data):
+    temp_path = get_temp_path(path)
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    with open(temp_path, mode) as temp_file:
+        temp_file.write(data)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+    _sync_dir(os.path.dirname(path))
+
+
+def discard_file(temp_path):
+    try:
+        os.unlink(temp_path)
+    except FileNotFoundError:
+        pass
+
+
+def _sync_dir(dir_path):
+    try:
+        fd = os.open(dir_path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,414 @@
+# generators.py
+#
+# Copyright 2018 Cosimo Cecchi
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Metadata generators shared by the sugarapp-gen-* scripts. This module is
+# used at build time and must not depend on gi or sugar3.
+
+import configparser
+import hashlib
+import io
+import os
+import subprocess
+import tempfile
+
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree as ET
+from xml.dom import minidom
+
+from .fileutils import commit_file
+from .fileutils import discard_file
+from .fileutils import get_temp_path
+from .fileutils import write_file
+
+
+LICENSE_MAP = {
+    'GPLv2+': 'GPL-2.0-or-later',
+    'GPLv3+': 'GPL-3.0-or-later',
+    'LGPLv2+': 'LGPL-2.0-or-later',
+    'LGPLv2.1+': 'LGPL-2.1-or-later',
+}
+
+MIMETYPES_FIELDS = [
+    'bundle_id',
+    'name']
+
+APPDATA_FIELDS = [
+    'bundle_id',
+    'metadata_license',
+    'license',
+    'name',
+    'description',
+    'update_contact',
+    'release_date',
+    'developer_name',
+    'developer_id']
+
+DESKTOP_FIELDS = [
+    'name',
+    'bundle_id',
+    'summary',
+    'tags']
+
+RESOURCES_NAME = 'resources.gresource'
+
+RESOURCES_EXCLUDED_DIRS = [
+    '.git',
+    '__pycache__',
+    'icons-cache',
+    'locale',
+    'po']
+
+RESOURCES_EXCLUDED_SUFFIXES = [
+    '.py',
+    '.pyc',
+    '.pyo',
+    '.po',
+    '.mo',
+    '.gresource',
+    '.hash']
+
+
+class GeneratorError(Exception):
+    pass
+
+
+class ActivityInfo(object):
+
+    def __init__(self, info_path):
+        self.path = info_path
+        self._info = configparser.ConfigParser()
+        try:
+            with open(info_path, 'r') as info_file:
+                self.contents = info_file.read()
+        except OSError:
+            self.contents = ''
+        self._info.read_string(self.contents, source=info_path)
+
+    def has(self, name):
+        return self._info.has_option('Activity', name)
+
+    def get(self, name):
+        return self._info.get('Activity', name)
+
+    def require(self, fields, message):
+        for name in fields:
+            if not self.has(name):
+                raise GeneratorError(message.format(name))
+
+    def get_sanitized_name(self):
+        return self.get('name').replace(' ', '').lower()
+
+    def get_mimetype(self):
+        return 'application/x-{}-activity'.format(self.get_sanitized_name())
+
+    def get_glob(self):
+        return '*.{}'.format(self.get_sanitized_name())
+
+
+def _prettify(root):
+    return minidom.parseString(ET.tostring(root)).toprettyxml(indent='    ')
+
+
+def generate_mimetypes(info):
+    info.require(
+        MIMETYPES_FIELDS, 'Activity needs {} metadata for mimetypes')
+
+    mime_info = ET.Element(
+        'mime-info',
+        xmlns='http://www.freedesktop.org/standards/shared-mime-info')
+    mime_type = ET.SubElement(
+        mime_info,
+        'mime-type',
+        type=info.get_mimetype())
+    ET.SubElement(mime_type, 'comment', attrib={'xml:lang': 'en'}).text = \
+        info.get('name')
+    ET.SubElement(mime_type, 'glob', pattern=info.get_glob())
+
+    return _prettify(mime_info)
+
+
+def generate_appdata(info):
+    info.require(
+        APPDATA_FIELDS, 'Activity needs {} metadata for AppStream file')
+
+    bundle_id = info.get('bundle_id')
+
+    # See https://www.freedesktop.org/software/appstream/docs/
+    root = ET.Element('component', type='desktop-application')
+    ET.SubElement(root, 'translation', type='gettext').text = \
+        bundle_id
+    ET.SubElement(root, 'update_contact').text = \
+        info.get('update_contact')
+    dev = ET.SubElement(root, 'developer', id=info.get('developer_id'))
+    ET.SubElement(dev, 'name').text = \
+        info.get('developer_name')
+    ET.SubElement(root, 'id').text = bundle_id
+    ET.SubElement(root, 'launchable', type='desktop-id').text = \
+        bundle_id + '.desktop'
+    desc = ET.fromstring('<description><p>{}</p></description>'.format(
+        info.get('description')))
+    root.append(desc)
+
+    ET.SubElement(root, 'content_rating', type='oars-1.1')
+
+    release_pairs = [
+        (info.get('activity_version'), info.get('release_date'))]
+    releases_root = ET.SubElement(root, 'releases')
+    for version, date in release_pairs:
+        ET.SubElement(releases_root, 'release', date=date, version=version)
+
+    licenses = info.get('license').split(';')
+    spdx_licenses = map(lambda x: LICENSE_MAP.get(x, x), licenses)
+    ET.SubElement(root, 'project_license').text = ' AND '.join(spdx_licenses)
+
+    copy_pairs = [('metadata_license', 'metadata_license'),
+                  ('summary', 'summary'),
+                  ('name', 'name')]
+    for key, ename in copy_pairs:
+        ET.SubElement(root, ename).text = info.get(key)
+
+    if info.has('screenshots'):
+        screenshots = info.get('screenshots').split(' ')
+        ss_root = ET.SubElement(root, 'screenshots')
+        for i, screenshot in enumerate(screenshots):
+            e = ET.SubElement(ss_root, 'screenshot')
+            if i == 0:
+                e.set('type', 'default')
+            ET.SubElement(e, 'image').text = screenshot.strip()
+
+    if info.has('url'):
+        ET.SubElement(root, 'url', type='homepage').text = \
+            info.get('url')
+    if info.has('repository_url'):
+        ET.SubElement(root, 'url', type='bugtracker').text = \
+            info.get('repository_url')
+    elif info.has('repository'):
+        ET.SubElement(root, 'url', type='bugtracker').text = \
+            info.get('repository')
+
+    return _prettify(root)
+
+
+def generate_desktop(info, mimetype=None):
+    info.require(
+        DESKTOP_FIELDS, 'Activity needs {} metadata file for desktop')
+
+    section = 'Desktop Entry'
+    desktop = configparser.ConfigParser()
+    desktop.optionxform = str
+    desktop.add_section(section)
+    desktop.set(section, 'Name', info.get('name'))
+    desktop.set(section, 'GenericName', info.get('name'))
+    desktop.set(section, 'TryExec', 'sugarapp')
+    desktop.set(section, 'Exec', 'sugarapp')
+    desktop.set(section, 'Icon', info.get('bundle_id'))
+    desktop.set(section, 'Type', 'Application')
+    desktop.set(section, 'Comment', info.get('summary'))
+    desktop.set(section, 'Terminal', 'false')
+    desktop.set(section, 'StartupNotify', 'true')
+    desktop.set(section, 'Categories', '%s;' % info.get('tags'))
+
+    if mimetype:
+        desktop.set(section, 'MimeType', mimetype + ';')
+
+    output = io.StringIO()
+    desktop.write(output)
+    return output.getvalue()
+
+
+def get_resources_prefix(bundle_id):
+    return '/' + bundle_id.replace('.', '/')
+
+
+def get_resources_path(bundle_path):
+    return os.path.join(bundle_path, 'activity', RESOURCES_NAME)
+
+
+def get_resources_files(bundle_path):
+    files = []
+    for root, dirs, names in os.walk(bundle_path):
+        dirs[:] = sorted(name for name in dirs
+                         if name not in RESOURCES_EXCLUDED_DIRS)
+        for name in sorted(names):
+            if os.path.splitext(name)[1] in RESOURCES_EXCLUDED_SUFFIXES:
+                continue
+            path = os.path.join(root, name)
+            files.append(os.path.relpath(path, bundle_path))
+    return files
+
+
+def generate_resources(info, files):
+    info.require(['bundle_id'], 'Activity needs {} metadata for resources')
+
+    # Files are left uncompressed so they can be used straight from the
+    # memory mapped resource file.
+    root = ET.Element('gresources')
+    resource = ET.SubElement(
+        root,
+        'gresource',
+        prefix=get_resources_prefix(info.get('bundle_id')))
+    for path in files:
+        ET.SubElement(resource, 'file').text = path.replace(os.sep, '/')
+
+    return _prettify(root)
+
+
+def get_resources_hash(bundle_path, files):
+    inputs = []
+    for path in files:
+        stat = os.stat(os.path.join(bundle_path, path))
+        inputs.append('{}:{}:{}'.format(path, stat.st_mtime_ns, stat.st_size))
+    return get_input_hash('resources', *inputs)
+
+
+def compile_resources(bundle_path, output_path, incremental=False):
+    info = ActivityInfo(get_info_path(bundle_path))
+    files = get_resources_files(bundle_path)
+
+    input_hash = None
+    if incremental:
+        input_hash = get_resources_hash(bundle_path, files)
+        if is_up_to_date(output_path, input_hash):
+            return False
+
+    # Running activities keep the resource file mapped, so it is never
+    # rewritten in place.
+    xml_data = generate_resources(info, files)
+    temp_path = get_temp_path(output_path)
+    with tempfile.NamedTemporaryFile('w', suffix='.xml') as xml_file:
+        xml_file.write(xml_data)
+        xml_file.flush()
+        try:
+            subprocess.run(
+                ['glib-compile-resources',
+                 '--sourcedir', bundle_path,
+                 '--target', temp_path,
+                 xml_file.name],
+                check=True,
+                stderr=subprocess.PIPE,
+                universal_newlines=True)
+        except OSError as e:
+            discard_file(temp_path)
+            raise GeneratorError(
+                'glib-compile-resources is not available: {}'.format(e))
+        except subprocess.CalledProcessError as e:
+            discard_file(temp_path)
+            raise GeneratorError(e.stderr.strip())
+    commit_file(temp_path, output_path)
+
+    if input_hash is not None:
+        write_file(output_path + '.hash', input_hash)
+    return True
+
+
+def read_mimetype(mimetypes_path):
+    if not mimetypes_path or not os.path.exists(mimetypes_path):
+        return None
+    for element in ET.parse(mimetypes_path).iter():
+        if element.tag.endswith('mime-type'):
+            return element.get('type')
+    return None
+
+
+def get_input_hash(kind, *inputs):
+    digest = hashlib.sha256()
+    with open(__file__, 'rb') as generator_file:
+        digest.update(generator_file.read())
+    digest.update(kind.encode('utf-8'))
+    for data in inputs:
+        data = (data or '').encode('utf-8')
+        digest.update(str(len(data)).encode('utf-8') + b':' + data)
+    return digest.hexdigest()
+
+
+def read_input(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r') as input_file:
+        return input_file.read()
+
+
+def is_up_to_date(path, input_hash):
+    if not os.path.exists(path):
+        return False
+    return read_input(path + '.hash') == input_hash
+
+
+def write_output(path, data, input_hash=None):
+    if input_hash is None:
+        with open(path, 'w') as output_file:
+            output_file.write(data)
+        return True
+
+    changed = read_input(path) != data
+    if changed:
+        write_file(path, data)
+    write_file(path + '.hash', input_hash)
+    return changed
+
+
+def get_info_path(bundle_path):
+    return os.path.join(bundle_path, 'activity', 'activity.info')
+
+
+def generate_bundle(bundle_path, output_path, incremental=False):
+    info = ActivityInfo(get_info_path(bundle_path))
+    info.require(['bundle_id'], 'Activity needs {} metadata')
+    bundle_id = info.get('bundle_id')
+
+    outputs = [
+        ('mimetypes', bundle_id + '.xml',
+         lambda: generate_mimetypes(info)),
+        ('appdata', bundle_id + '.appdata.xml',
+         lambda: generate_appdata(info)),
+        ('desktop', bundle_id + '.desktop',
+         lambda: generate_desktop(info, info.get_mimetype())),
+    ]
+    for kind, name, generate in outputs:
+        path = os.path.join(output_path, name)
+        input_hash = None
+        if incremental:
+            input_hash = get_input_hash(kind, info.contents)
+            if is_up_to_date(path, input_hash):
+                continue
+        write_output(path, generate(), input_hash)
+    return bundle_id
+
+
+def _generate_bundle_safe(bundle_path, output_path, incremental):
+    try:
+        bundle_id = generate_bundle(bundle_path, output_path, incremental)
+        return bundle_path, bundle_id, None
+    except (GeneratorError, OSError, configparser.Error, ET.ParseError) as e:
+        return bundle_path, None, str(e)
+
+
+def generate_catalog(bundle_paths, output_path, jobs=None, incremental=False):
+    os.makedirs(output_path, exist_ok=True)
+    if jobs == 1:
+        return [_generate_bundle_safe(path, output_path, incremental)
+                for path in bundle_paths]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            _generate_bundle_safe,
+            bundle_paths,
+            [output_path] * len(bundle_paths),
+            [incremental] * len(bundle_paths),
+            chunksize=max(1, len(bundle_paths) // 64)))
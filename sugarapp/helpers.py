@@ -18,11 +18,78 @@
 # Boston, MA 02111-1307, USA.
 
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository import GObject
 
 
+class _MonitorService(GObject.GObject):
+
+    __gsignals__ = {
+        'changed': (GObject.SignalFlags.RUN_FIRST, None, ([])),
+    }
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self._display = Gdk.Display.get_default()
+        self._display.connect('monitor-added', self.__monitors_changed_cb)
+        self._display.connect('monitor-removed', self.__monitors_changed_cb)
+        self._display.get_default_screen().connect(
+            'monitors-changed', self.__monitors_changed_cb)
+        self._watched = []
+        self._state = None
+
+    def get_state(self):
+        if self._state is None:
+            self._state = self._compute()
+        return self._state
+
+    def _compute(self):
+        number = 0
+        monitor = self._display.get_primary_monitor()
+        for n in range(0, self._display.get_n_monitors()):
+            candidate = self._display.get_monitor(n)
+            if candidate.is_primary():
+                number = n
+                break
+        # wayland don't support primary monitor
+        if monitor is None:
+            monitor = self._display.get_monitor(number)
+
+        self._unwatch()
+        for name in ['geometry', 'workarea', 'scale-factor']:
+            handler = monitor.connect(
+                'notify::' + name, self.__monitors_changed_cb)
+            self._watched.append((monitor, handler))
+
+        return {
+            'number': number,
+            'monitor': monitor,
+            'geometry': monitor.get_geometry(),
+            'workarea': monitor.get_workarea(),
+            'scale_factor': monitor.get_scale_factor(),
+        }
+
+    def _unwatch(self):
+        for monitor, handler in self._watched:
+            monitor.disconnect(handler)
+        self._watched = []
+
+    def __monitors_changed_cb(self, *args):
+        self._unwatch()
+        self._state = None
+        self.emit('changed')
+
+
 class PrimaryMonitor(object):
 
+    _service = None
+
+    @staticmethod
+    def get_default():
+        if PrimaryMonitor._service is None:
+            PrimaryMonitor._service = _MonitorService()
+        return PrimaryMonitor._service
+
     @staticmethod
     def width():
         geometry = PrimaryMonitor.get_geometry()
@@ -35,25 +102,92 @@ class PrimaryMonitor(object):
 
     @staticmethod
     def get_geometry():
-        monitor = PrimaryMonitor.get_monitor()
-        return monitor.get_geometry()
+        return PrimaryMonitor.get_default().get_state()['geometry']
+
+    @staticmethod
+    def get_workarea():
+        return PrimaryMonitor.get_default().get_state()['workarea']
+
+    @staticmethod
+    def get_scale_factor():
+        return PrimaryMonitor.get_default().get_state()['scale_factor']
 
     @staticmethod
     def get_monitor():
-        display = Gdk.Display.get_default()
-        monitor = display.get_primary_monitor()
-        # wayland don't support primary monitor
-        if monitor is None:
-            monitor = display.get_monitor(PrimaryMonitor.get_number())
-        return monitor
+        return PrimaryMonitor.get_default().get_state()['monitor']
 
     @staticmethod
     def get_number():
-        display = Gdk.Display.get_default()
-        number = 0
-        for n in range(0, display.get_n_monitors() + 1):
-            monitor = display.get_monitor(n)
-            if monitor.is_primary():
-                number = n
-                break
-        return number
+        return PrimaryMonitor.get_default().get_state()['number']
+
+
+class MotionCoalescer(GObject.GObject):
+
+    __gsignals__ = {
+        'motion': (GObject.SignalFlags.RUN_FIRST, None, ([object, object])),
+    }
+
+    def __init__(self, widget):
+        GObject.GObject.__init__(self)
+        self._widget = widget
+        self._pending = {}
+        self._tick_id = None
+        self.raw_events = 0
+        self.delivered_events = 0
+
+        widget.add_events(Gdk.EventMask.POINTER_MOTION_MASK |
+                          Gdk.EventMask.TOUCH_MASK)
+        widget.connect('motion-notify-event', self.__motion_notify_event_cb)
+        widget.connect('touch-event', self.__touch_event_cb)
+        widget.connect('button-press-event', self.__button_event_cb)
+        widget.connect('button-release-event', self.__button_event_cb)
+        widget.connect('unmap', self.__unmap_cb)
+        # GDK already merges motion events per frame, which would hide the
+        # intermediate points the 'motion' signal reports
+        widget.connect('realize', self.__realize_cb)
+        if widget.get_realized():
+            self.__realize_cb(widget)
+
+    def flush(self):
+        if self._tick_id is not None:
+            self._widget.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+        pending = self._pending
+        self._pending = {}
+        for event, points in pending.values():
+            self.delivered_events += 1
+            self.emit('motion', event, points)
+
+    def _queue(self, key, event):
+        self.raw_events += 1
+        last_event, points = self._pending.get(key, (None, []))
+        points.append((event.x, event.y, event.time))
+        self._pending[key] = (event.copy(), points)
+        if self._tick_id is None:
+            self._tick_id = self._widget.add_tick_callback(self.__tick_cb)
+
+    def __tick_cb(self, widget, frame_clock):
+        self._tick_id = None
+        self.flush()
+        return GLib.SOURCE_REMOVE
+
+    def __realize_cb(self, widget):
+        widget.get_window().set_event_compression(False)
+
+    def __motion_notify_event_cb(self, widget, event):
+        self._queue(None, event)
+        return True
+
+    def __touch_event_cb(self, widget, event):
+        if event.type == Gdk.EventType.TOUCH_UPDATE:
+            self._queue(event.get_event_sequence(), event)
+            return True
+        self.flush()
+        return False
+
+    def __button_event_cb(self, widget, event):
+        self.flush()
+        return False
+
+    def __unmap_cb(self, widget):
+        self.flush()
@@ -0,0 +1,170 @@
+# iconcache.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import hashlib
+import logging
+import os
+import re
+
+from gi.repository import Gdk
+from gi.repository import GdkPixbuf
+from gi.repository import GLib
+from gi.repository import Gtk
+
+from . import resources
+from .fileutils import commit_file
+from .fileutils import discard_file
+from .fileutils import get_temp_path
+
+
+_logger = logging.getLogger()
+
+CACHE_VERSION = 1
+MAX_ENTRIES = 512
+WINDOW_ICON_SIZE = 128
+
+_memory = {}
+
+
+def get_cache_path():
+    return os.path.join(GLib.get_user_cache_dir(), 'sugarapp', 'icons')
+
+
+def get_bundle_cache_path(bundle_path):
+    return os.path.join(bundle_path, 'activity', 'icons-cache')
+
+
+def get_key(data, size, scale=1, fill_color=None, stroke_color=None):
+    # The key uses the icon contents rather than its modification time,
+    # which Flatpak resets on installed files.
+    digest = hashlib.sha256(data)
+    digest.update(repr((CACHE_VERSION, size, scale,
+                        fill_color, stroke_color)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_icon(path):
+    return resources.get_bytes(path).get_data()
+
+
+def render(data, size, fill_color=None, stroke_color=None):
+    if fill_color is not None:
+        data = re.sub(b'<!ENTITY fill_color "[^"]*">',
+                      b'<!ENTITY fill_color "%s">' % fill_color.encode(),
+                      data)
+    if stroke_color is not None:
+        data = re.sub(b'<!ENTITY stroke_color "[^"]*">',
+                      b'<!ENTITY stroke_color "%s">' % stroke_color.encode(),
+                      data)
+
+    loader = GdkPixbuf.PixbufLoader.new_with_type('svg')
+    loader.connect(
+        'size-prepared',
+        lambda loader, width, height: loader.set_size(size, size))
+    loader.write(data)
+    loader.close()
+    return loader.get_pixbuf()
+
+
+def store(directory, key, pixbuf):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key + '.png')
+    temp_path = get_temp_path(path)
+    try:
+        pixbuf.savev(temp_path, 'png', [], [])
+        commit_file(temp_path, path)
+    except (GLib.Error, OSError) as e:
+        discard_file(temp_path)
+        _logger.warning('could not cache icon %s: %s', path, e)
+
+
+def _load(path, touch):
+    try:
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+    except GLib.Error:
+        return None
+    if touch:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+    return pixbuf
+
+
+def _evict(directory, max_entries):
+    try:
+        entries = [entry for entry in os.scandir(directory)
+                   if entry.name.endswith('.png')]
+    except OSError:
+        return
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+    for entry in entries[:len(entries) - max_entries]:
+        discard_file(entry.path)
+
+
+def get_pixbuf(path, size, scale=1, fill_color=None, stroke_color=None):
+    try:
+        data = read_icon(path)
+    except GLib.Error as e:
+        _logger.warning('could not read icon %s: %s', path, e)
+        return None
+    key = get_key(data, size, scale, fill_color, stroke_color)
+
+    pixbuf = _memory.get(key)
+    if pixbuf is not None:
+        return pixbuf
+
+    bundle_path = os.environ.get('SUGAR_BUNDLE_PATH')
+    if bundle_path is not None:
+        pixbuf = _load(os.path.join(
+            get_bundle_cache_path(bundle_path), key + '.png'), False)
+
+    if pixbuf is None:
+        pixbuf = _load(os.path.join(get_cache_path(), key + '.png'), True)
+
+    if pixbuf is None:
+        try:
+            pixbuf = render(data, size * scale, fill_color, stroke_color)
+        except GLib.Error as e:
+            _logger.warning('could not render icon %s: %s', path, e)
+            return None
+        store(get_cache_path(), key, pixbuf)
+        _evict(get_cache_path(), MAX_ENTRIES)
+
+    _memory[key] = pixbuf
+    return pixbuf
+
+
+def lookup_icon(icon_name, size):
+    info = Gtk.IconTheme.get_default().lookup_icon(icon_name, size, 0)
+    if info is None or info.get_filename() is None:
+        return None
+    # Icons found through the resource path report a resource path, map it
+    # back to the bundle file for callers that open it directly.
+    return resources.get_filename(info.get_filename())
+
+
+def create_image(path, size, scale=1, fill_color=None, stroke_color=None):
+    pixbuf = get_pixbuf(path, size, scale, fill_color, stroke_color)
+    if pixbuf is None:
+        return None
+    surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
+    return Gtk.Image.new_from_surface(surface)
@@ -0,0 +1,238 @@
+# importer.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Precompiled bytecode and a module index for activity bundles, plus an
+# import time report. Used at build time, so it must not depend on gi.
+
+import compileall
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import json
+import os
+import py_compile
+import sys
+import threading
+import time
+
+from .fileutils import write_file
+
+
+INDEX_VERSION = 1
+INDEX_NAME = 'modules.json'
+
+EXCLUDED_DIRS = [
+    '.git',
+    '__pycache__',
+    'locale',
+    'po']
+
+_report = None
+
+
+def get_index_path(bundle_path):
+    return os.path.join(bundle_path, 'activity', INDEX_NAME)
+
+
+def build_index(bundle_path):
+    suffixes = ['.py'] + importlib.machinery.EXTENSION_SUFFIXES
+    modules = {}
+    for root, dirs, names in os.walk(bundle_path):
+        dirs[:] = sorted(name for name in dirs
+                         if name not in EXCLUDED_DIRS)
+
+        relative_root = os.path.relpath(root, bundle_path)
+        package = []
+        if relative_root != os.curdir:
+            package = relative_root.split(os.sep)
+            if not all(name.isidentifier() for name in package) or \
+                    '.'.join(package) not in modules:
+                dirs[:] = []
+                continue
+
+        for name in sorted(names):
+            suffix = next((suffix for suffix in suffixes
+                           if name.endswith(suffix)), None)
+            if suffix is None:
+                continue
+            module_name = name[:-len(suffix)]
+            if module_name == '__init__' or not module_name.isidentifier():
+                continue
+            modules['.'.join(package + [module_name])] = [
+                os.path.relpath(os.path.join(root, name), bundle_path), False]
+
+        for name in dirs:
+            init_path = os.path.join(root, name, '__init__.py')
+            if os.path.exists(init_path):
+                modules['.'.join(package + [name])] = [
+                    os.path.relpath(init_path, bundle_path), True]
+
+    return {'version': INDEX_VERSION, 'modules': modules}
+
+
+def compile_bundle(bundle_path, optimize=None, unchecked=False):
+    # Flatpak resets the modification time of installed files, so the
+    # bytecode is validated by source hash instead.
+    mode = py_compile.PycInvalidationMode.CHECKED_HASH
+    if unchecked:
+        mode = py_compile.PycInvalidationMode.UNCHECKED_HASH
+    # Only the bytecode for the optimization level of the interpreter is
+    # loaded, which by default is the one running this.
+    if not optimize:
+        optimize = [sys.flags.optimize]
+    success = compileall.compile_dir(
+        bundle_path,
+        quiet=1,
+        optimize=optimize,
+        invalidation_mode=mode)
+
+    index = build_index(bundle_path)
+    write_file(get_index_path(bundle_path),
+               json.dumps(index, separators=(',', ':')))
+    return bool(success)
+
+
+class BundleFinder(importlib.abc.MetaPathFinder):
+
+    def __init__(self, bundle_path, modules):
+        self._bundle_path = bundle_path
+        self._modules = modules
+
+    def find_spec(self, fullname, path=None, target=None):
+        entry = self._modules.get(fullname)
+        if entry is None:
+            return None
+        relative_path, is_package = entry
+        file_path = os.path.join(self._bundle_path, relative_path)
+        if not os.path.exists(file_path):
+            return None
+        locations = None
+        if is_package:
+            locations = [os.path.dirname(file_path)]
+        return importlib.util.spec_from_file_location(
+            fullname, file_path, submodule_search_locations=locations)
+
+
+def install(bundle_path):
+    try:
+        with open(get_index_path(bundle_path), 'r') as index_file:
+            index = json.loads(index_file.read())
+    except (OSError, ValueError):
+        return False
+    if not isinstance(index, dict) or \
+            index.get('version') != INDEX_VERSION:
+        return False
+
+    # Builtin and frozen modules can not be shadowed by bundle files.
+    position = 0
+    for number, finder in enumerate(sys.meta_path):
+        if finder in [importlib.machinery.BuiltinImporter,
+                      importlib.machinery.FrozenImporter] or \
+                isinstance(finder, ImportReport):
+            position = number + 1
+    sys.meta_path.insert(
+        position, BundleFinder(bundle_path, index['modules']))
+
+    # Modules added after the index was built are still found, but
+    # only after everything else.
+    sys.path.append(bundle_path)
+    return True
+
+
+class _TimedLoader(object):
+
+    def __init__(self, loader, report, name):
+        self._loader = loader
+        self._report = report
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._report.begin(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._report.end()
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class ImportReport(importlib.abc.MetaPathFinder):
+
+    def __init__(self):
+        self._local = threading.local()
+        self._times = {}
+
+    def find_spec(self, fullname, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, self, fullname)
+        return spec
+
+    def _get_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def begin(self, name):
+        self._get_stack().append([name, time.perf_counter(), 0.0])
+
+    def end(self):
+        stack = self._get_stack()
+        name, start, children = stack.pop()
+        elapsed = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += elapsed
+        self._times[name] = (elapsed - children, elapsed)
+
+    def get_times(self):
+        return sorted(self._times.items(),
+                      key=lambda item: item[1][1], reverse=True)
+
+    def write(self, path):
+        lines = ['%12s %12s  %s' % ('self ms', 'total ms', 'module')]
+        for name, (self_time, total_time) in self.get_times():
+            lines.append('%12.3f %12.3f  %s' % (
+                self_time * 1000, total_time * 1000, name))
+        write_file(path, '\n'.join(lines) + '\n')
+
+
+def start_report():
+    global _report
+
+    if _report is None:
+        _report = ImportReport()
+        sys.meta_path.insert(0, _report)
+    return _report
+
+
+def write_report(path):
+    if _report is not None:
+        _report.write(path)
@@ -0,0 +1,197 @@
+# logs.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Buffered logging, enabled by pointing SUGARAPP_LOG to the log file.
+# Records are queued by the logging thread and formatted and written by a
+# background thread, the most recent ones are also kept in memory and
+# dumped next to the log file on crash and on shutdown.
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+from .fileutils import write_file
+
+
+FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+LEVELS = {
+    'all': logging.NOTSET,
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+_listener = None
+_handler = None
+_buffer = None
+_path = None
+_excepthook = None
+_threading_excepthook = None
+_crashed = False
+_lock = threading.Lock()
+
+
+class RingBuffer(logging.Handler):
+
+    def __init__(self, capacity):
+        logging.Handler.__init__(self)
+        self._lines = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            self._lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def get_lines(self):
+        self.acquire()
+        try:
+            return list(self._lines)
+        finally:
+            self.release()
+
+    def dump(self, path):
+        write_file(path, ''.join(line + '\n' for line in self.get_lines()))
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # Only merge the arguments here, so they are captured as they are
+        # now, and leave the formatting to the writer thread. The root
+        # logger handlers run last, so the record can be updated in place.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def get_level():
+    return LEVELS.get(
+        os.environ.get('SUGAR_LOGGER_LEVEL', '').lower(), logging.ERROR)
+
+
+def is_started():
+    return _listener is not None
+
+
+def start(path, max_bytes=1024 * 1024, backups=3, capacity=1000):
+    global _listener, _handler, _buffer, _path
+    global _excepthook, _threading_excepthook
+
+    if _listener is not None:
+        return
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter(FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backups, delay=True)
+    file_handler.setFormatter(formatter)
+    _buffer = RingBuffer(capacity)
+    _buffer.setFormatter(formatter)
+
+    _handler = _QueueHandler(queue.SimpleQueue())
+    _listener = logging.handlers.QueueListener(
+        _handler.queue, file_handler, _buffer)
+    _listener.start()
+    _path = path
+
+    root = logging.getLogger()
+    root.setLevel(get_level())
+    root.addHandler(_handler)
+
+    _excepthook = sys.excepthook
+    sys.excepthook = _excepthook_cb
+    _threading_excepthook = threading.excepthook
+    threading.excepthook = _threading_excepthook_cb
+    atexit.register(shutdown)
+
+
+def stop():
+    global _listener, _handler
+
+    if _listener is None:
+        return
+
+    atexit.unregister(shutdown)
+    sys.excepthook = _excepthook
+    threading.excepthook = _threading_excepthook
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    dump(_path + '.last')
+    _listener = None
+    _handler = None
+
+
+def shutdown():
+    # Called at exit, and explicitly by processes that leave with
+    # os._exit() and skip atexit.
+    stop()
+    if _crashed and _path is not None:
+        dump(_path + '.crash')
+
+
+def flush():
+    if _listener is None:
+        return
+    # QueueListener has no flush, restarting it drains the queue.
+    with _lock:
+        _listener.stop()
+        _listener.start()
+
+
+def dump(path):
+    if _buffer is not None:
+        try:
+            _buffer.dump(path)
+        except OSError as e:
+            sys.stderr.write('could not dump log buffer: %s\n' % e)
+
+
+def _crash(exc_type, exc_value, exc_traceback):
+    global _crashed
+
+    # PyGObject reports every exception raised in a callback here, most
+    # of them are not fatal, so the dump waits until the process exits
+    # without going through stop().
+    logging.getLogger().critical(
+        'unhandled exception',
+        exc_info=(exc_type, exc_value, exc_traceback))
+    _crashed = True
+
+
+def _excepthook_cb(exc_type, exc_value, exc_traceback):
+    _crash(exc_type, exc_value, exc_traceback)
+    _excepthook(exc_type, exc_value, exc_traceback)
+
+
+def _threading_excepthook_cb(args):
+    _crash(args.exc_type, args.exc_value, args.exc_traceback)
+    _threading_excepthook(args)
@@ -0,0 +1,124 @@
+# profiling.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+
+from gi.repository import GLib
+
+from . import tracing
+
+
+_logger = logging.getLogger()
+
+
+class StallWatchdog(object):
+
+    def __init__(self, threshold):
+        self._threshold = threshold
+        self._main_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._reported = False
+        self._running = False
+        self._source_id = None
+        self._thread = None
+        self.stalls = 0
+
+    def start(self):
+        self._running = True
+        interval = max(1, int(self._threshold * 1000 / 4))
+        self._source_id = GLib.timeout_add(interval, self.__heartbeat_cb)
+        self._thread = threading.Thread(
+            target=self.__watch, args=(interval / 1000.0,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+    def __heartbeat_cb(self):
+        if self._reported:
+            stalled = time.monotonic() - self._last_beat
+            _logger.warning('main loop resumed after %.3fs', stalled)
+        self._last_beat = time.monotonic()
+        self._reported = False
+        return True
+
+    def __watch(self, interval):
+        while self._running:
+            time.sleep(interval)
+            stalled = time.monotonic() - self._last_beat
+            if stalled < self._threshold or self._reported:
+                continue
+            self._reported = True
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self._main_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else ''
+            _logger.warning('main loop stalled for %.3fs at:\n%s',
+                            stalled, stack)
+            tracing.mark('stall', args={'stack': stack})
+
+
+class Profiler(object):
+
+    def __init__(self, profile=False, memory=False):
+        self._profile = None
+        self._memory = memory
+        if profile:
+            self._profile = cProfile.Profile()
+
+    def start(self):
+        if self._memory:
+            tracemalloc.start(25)
+        if self._profile is not None:
+            self._profile.enable()
+
+    def stop(self, directory):
+        if self._profile is not None:
+            self._profile.disable()
+            path = os.path.join(directory, 'profile.pstats')
+            self._profile.dump_stats(path)
+            _logger.info('profile written to %s', path)
+
+        if self._memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            path = os.path.join(directory, 'tracemalloc.txt')
+            with open(path, 'w') as memory_file:
+                for stat in snapshot.statistics('lineno')[:100]:
+                    memory_file.write('%s\n' % stat)
+            _logger.info('memory allocations written to %s', path)
+
+
+def get_rss():
+    try:
+        with open('/proc/self/statm', 'r') as statm_file:
+            pages = int(statm_file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
@@ -0,0 +1,137 @@
+# registry.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Index from mime types and file suffixes to the bundles that handle them.
+# Used at build time and by launchers, so it must not depend on gi.
+
+import json
+import os
+
+from xml.etree import ElementTree as ET
+
+from .fileutils import write_file
+from .generators import ActivityInfo
+from .generators import get_info_path
+
+
+REGISTRY_VERSION = 3
+
+_MIME_NAMESPACE = '{http://www.freedesktop.org/standards/shared-mime-info}'
+
+
+def read_bundle_types(bundle_path):
+    info = ActivityInfo(get_info_path(bundle_path))
+    bundle_id = info.get('bundle_id')
+
+    mimetypes_path = os.path.join(bundle_path, 'activity', 'mimetypes.xml')
+    if not os.path.exists(mimetypes_path):
+        return bundle_id, [info.get_mimetype()], [info.get_glob()[1:]]
+
+    types = []
+    suffixes = []
+    root = ET.parse(mimetypes_path).getroot()
+    for mime_type in root.iter(_MIME_NAMESPACE + 'mime-type'):
+        types.append(mime_type.get('type'))
+        for glob in mime_type.iter(_MIME_NAMESPACE + 'glob'):
+            pattern = glob.get('pattern', '')
+            if pattern.startswith('*.'):
+                suffixes.append(pattern[1:])
+    return bundle_id, types, suffixes
+
+
+class Registry(object):
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {
+                'version': REGISTRY_VERSION,
+                'prefix': '',
+                'bundles': [],
+                'mimetypes': {},
+                'suffixes': {},
+            }
+        self._data = data
+
+    @staticmethod
+    def load(path):
+        with open(path, 'r') as registry_file:
+            data = json.loads(registry_file.read())
+        if data.get('version') != REGISTRY_VERSION:
+            raise ValueError('unsupported registry version')
+        return Registry(data)
+
+    @staticmethod
+    def build(bundle_paths, prefix=None):
+        registry = Registry()
+        # bundles are often indexed from a build directory, the prefix is
+        # where they will be found once installed
+        if prefix is not None:
+            registry._data['prefix'] = prefix
+        for bundle_path in bundle_paths:
+            bundle_id, types, suffixes = read_bundle_types(bundle_path)
+            if prefix is None:
+                bundle_path = os.path.abspath(bundle_path)
+            else:
+                bundle_path = os.path.basename(os.path.normpath(bundle_path))
+            registry.add(bundle_id, bundle_path, types, suffixes)
+        return registry
+
+    def save(self, path):
+        write_file(path, json.dumps(self._data, separators=(',', ':')))
+
+    def add(self, bundle_id, bundle_path, types, suffixes):
+        index = len(self._data['bundles'])
+        self._data['bundles'].append([bundle_id, bundle_path])
+        for type_name in types:
+            self._data['mimetypes'].setdefault(type_name, []).append(index)
+        for suffix in suffixes:
+            self._data['suffixes'].setdefault(
+                suffix.lower(), []).append(index)
+
+    def get_bundles(self):
+        return [self._get_bundle(index)
+                for index in range(len(self._data['bundles']))]
+
+    def _get_bundle(self, index):
+        bundle_id, bundle_path = self._data['bundles'][index]
+        return bundle_id, os.path.join(self._data['prefix'], bundle_path)
+
+    def _choose(self, indexes, preferred):
+        # types like image/png are handled by many bundles, the first one
+        # registered is only used when the preferred one is not among them
+        for index in indexes:
+            if self._data['bundles'][index][0] == preferred:
+                return self._get_bundle(index)
+        return self._get_bundle(indexes[0])
+
+    def lookup_mimetype(self, type_name, preferred=None):
+        indexes = self._data['mimetypes'].get(type_name)
+        if not indexes:
+            return None
+        return self._choose(indexes, preferred)
+
+    def lookup_filename(self, filename, preferred=None):
+        name = os.path.basename(filename).lower()
+        position = name.find('.')
+        while position != -1:
+            indexes = self._data['suffixes'].get(name[position:])
+            if indexes:
+                return self._choose(indexes, preferred)
+            position = name.find('.', position + 1)
+        return None
@@ -0,0 +1,109 @@
+# resources.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import logging
+import os
+
+from gi.repository import Gio
+from gi.repository import GLib
+from gi.repository import Gtk
+
+from .generators import get_resources_path
+from .generators import get_resources_prefix
+
+
+_logger = logging.getLogger()
+
+_resource = None
+_prefix = None
+_bundle_path = None
+
+
+def register(bundle_path, bundle_id):
+    global _resource, _prefix, _bundle_path
+
+    if _resource is not None:
+        return True
+
+    path = get_resources_path(bundle_path)
+    if not os.path.exists(path):
+        return False
+
+    # Gio.Resource.load maps the file, uncompressed entries are then
+    # served without copies.
+    try:
+        resource = Gio.Resource.load(path)
+    except GLib.Error as e:
+        _logger.warning('could not load resources %s: %s', path, e)
+        return False
+
+    Gio.resources_register(resource)
+    _resource = resource
+    _prefix = get_resources_prefix(bundle_id)
+    _bundle_path = os.path.abspath(bundle_path)
+
+    Gtk.IconTheme.get_default().add_resource_path(_prefix + '/icons')
+    return True
+
+
+def is_registered():
+    return _resource is not None
+
+
+def lookup(path):
+    if _resource is None:
+        return None
+
+    path = os.path.join(_bundle_path, path)
+    relative_path = os.path.relpath(path, _bundle_path)
+    if relative_path.startswith(os.pardir):
+        return None
+
+    resource_path = '%s/%s' % (_prefix, relative_path.replace(os.sep, '/'))
+    try:
+        _resource.get_info(resource_path, Gio.ResourceLookupFlags.NONE)
+    except GLib.Error:
+        return None
+    return resource_path
+
+
+def get_filename(resource_path):
+    if _resource is None or not resource_path.startswith(_prefix + '/'):
+        return resource_path
+    relative_path = resource_path[len(_prefix) + 1:]
+    return os.path.join(_bundle_path, *relative_path.split('/'))
+
+
+def get_file(path):
+    resource_path = lookup(path)
+    if resource_path is not None:
+        return Gio.File.new_for_uri('resource://' + resource_path)
+    if not os.path.isabs(path):
+        path = os.path.join(
+            _bundle_path or os.environ['SUGAR_BUNDLE_PATH'], path)
+    return Gio.File.new_for_path(path)
+
+
+def get_bytes(path):
+    resource_path = lookup(path)
+    if resource_path is not None:
+        return _resource.lookup_data(
+            resource_path, Gio.ResourceLookupFlags.NONE)
+    contents = get_file(path).load_contents(None)[1]
+    return GLib.Bytes.new(contents)
@@ -0,0 +1,202 @@
+# scheduler.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import gi
+
+gi.require_version('Gtk', '3.0')
+
+from gi.repository import GLib
+
+
+_DEFAULT_INTERVAL = 16667
+_HISTOGRAM_BOUNDS = [8, 16, 33, 50, 100]
+
+
+class FrameScheduler(object):
+
+    def __init__(self, activity):
+        self._activity = activity
+        self._callbacks = {}
+        self._next_id = 1
+        self._tick_id = None
+        self._last_frame_time = None
+        self._overlay_id = None
+        self._overlay_canvas = None
+        self.reset_stats()
+
+        activity.connect('notify::on-screen', self.__on_screen_cb)
+
+    def add(self, callback, *args):
+        callback_id = self._next_id
+        self._next_id += 1
+        self._callbacks[callback_id] = (callback, args)
+        self._update()
+        return callback_id
+
+    def remove(self, callback_id):
+        self._callbacks.pop(callback_id, None)
+        self._update()
+
+    def is_running(self):
+        return self._tick_id is not None
+
+    def reset_stats(self):
+        self._frames = 0
+        self._dropped = 0
+        self._elapsed = 0
+        self._histogram = [0] * (len(_HISTOGRAM_BOUNDS) + 1)
+
+    def get_stats(self):
+        fps = 0.0
+        if self._elapsed:
+            fps = self._frames * 1000000.0 / self._elapsed
+        labels = ['<%dms' % bound for bound in _HISTOGRAM_BOUNDS]
+        labels.append('>=%dms' % _HISTOGRAM_BOUNDS[-1])
+        return {
+            'frames': self._frames,
+            'dropped': self._dropped,
+            'fps': fps,
+            'histogram': dict(zip(labels, self._histogram)),
+        }
+
+    def enable_overlay(self, canvas):
+        if self._overlay_id is not None:
+            return
+        self._overlay_id = canvas.connect_after('draw', self.__draw_cb)
+        self._overlay_canvas = canvas
+
+    def _update(self):
+        # unlike the active state this ignores focus, so animations keep
+        # running while a dialog or another window has it
+        should_run = bool(self._callbacks) and self._activity.get_on_screen()
+        if should_run and self._tick_id is None:
+            self._last_frame_time = None
+            self._tick_id = self._activity.add_tick_callback(self.__tick_cb)
+        elif not should_run and self._tick_id is not None:
+            self._activity.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+
+    def _record(self, frame_clock):
+        frame_time = frame_clock.get_frame_time()
+        if self._last_frame_time is not None:
+            delta = frame_time - self._last_frame_time
+            interval = _DEFAULT_INTERVAL
+            timings = frame_clock.get_current_timings()
+            if timings is not None and timings.get_refresh_interval():
+                interval = timings.get_refresh_interval()
+
+            self._frames += 1
+            self._elapsed += delta
+            if delta > interval * 1.5:
+                self._dropped += int(round(float(delta) / interval)) - 1
+
+            index = len(_HISTOGRAM_BOUNDS)
+            for position, bound in enumerate(_HISTOGRAM_BOUNDS):
+                if delta < bound * 1000:
+                    index = position
+                    break
+            self._histogram[index] += 1
+        self._last_frame_time = frame_time
+
+    def __tick_cb(self, widget, frame_clock):
+        self._record(frame_clock)
+        for callback_id, (callback, args) in list(self._callbacks.items()):
+            if not callback(self, frame_clock, *args):
+                self._callbacks.pop(callback_id, None)
+        if self._overlay_canvas is not None:
+            self._overlay_canvas.queue_draw()
+        if not self._callbacks:
+            self._tick_id = None
+            return GLib.SOURCE_REMOVE
+        return GLib.SOURCE_CONTINUE
+
+    def __draw_cb(self, canvas, cr):
+        stats = self.get_stats()
+        text = '%.1f fps, %d dropped' % (stats['fps'], stats['dropped'])
+        cr.set_font_size(14)
+        extents = cr.text_extents(text)
+        cr.set_source_rgba(0, 0, 0, 0.6)
+        cr.rectangle(4, 4, extents.width + 12, extents.height + 12)
+        cr.fill()
+        cr.set_source_rgb(1, 1, 1)
+        cr.move_to(10, 10 + extents.height)
+        cr.show_text(text)
+        return False
+
+    def __on_screen_cb(self, activity, pspec):
+        self._update()
+
+
+class _Timer(object):
+
+    def __init__(self, interval, inactive_interval, callback, args):
+        self.interval = interval
+        self.inactive_interval = inactive_interval
+        self.callback = callback
+        self.args = args
+        self.source_id = None
+
+
+class TimerThrottle(object):
+
+    def __init__(self):
+        self._timers = {}
+        self._next_id = 1
+        self._active = True
+
+    def add(self, interval, callback, *args, inactive_interval=0):
+        timer_id = self._next_id
+        self._next_id += 1
+        self._timers[timer_id] = _Timer(
+            interval, inactive_interval, callback, args)
+        self._schedule(timer_id)
+        return timer_id
+
+    def remove(self, timer_id):
+        timer = self._timers.pop(timer_id, None)
+        if timer is not None and timer.source_id is not None:
+            GLib.source_remove(timer.source_id)
+
+    def set_active(self, active):
+        if active == self._active:
+            return
+        self._active = active
+        for timer_id in list(self._timers.keys()):
+            self._schedule(timer_id)
+
+    def _schedule(self, timer_id):
+        timer = self._timers[timer_id]
+        if timer.source_id is not None:
+            GLib.source_remove(timer.source_id)
+            timer.source_id = None
+        interval = timer.interval
+        if not self._active:
+            interval = timer.inactive_interval
+        if interval:
+            timer.source_id = GLib.timeout_add(
+                interval, self.__timeout_cb, timer_id)
+
+    def __timeout_cb(self, timer_id):
+        timer = self._timers.get(timer_id)
+        if timer is None:
+            return False
+        if timer.callback(*timer.args):
+            return True
+        self._timers.pop(timer_id, None)
+        return False
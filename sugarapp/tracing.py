@@ -0,0 +1,95 @@
+# tracing.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Startup tracing, enabled by pointing SUGARAPP_TRACE to the file where
+# the trace must be written. The output uses the Chrome trace event format
+# so it can be loaded in about:tracing or Perfetto.
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+_logger = logging.getLogger()
+
+_events = []
+_lock = threading.Lock()
+
+
+def is_enabled():
+    return bool(os.environ.get('SUGARAPP_TRACE'))
+
+
+def _add(name, phase, timestamp=None, args=None):
+    if not is_enabled():
+        return
+    if timestamp is None:
+        timestamp = time.monotonic()
+    event = {
+        'name': name,
+        'cat': 'sugarapp',
+        'ph': phase,
+        'ts': int(timestamp * 1000000),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+    }
+    if phase == 'i':
+        event['s'] = 'p'
+    if args:
+        event['args'] = args
+    with _lock:
+        _events.append(event)
+
+
+def begin(name, args=None):
+    _add(name, 'B', args=args)
+
+
+def end(name, args=None):
+    _add(name, 'E', args=args)
+
+
+def mark(name, timestamp=None, args=None):
+    _add(name, 'i', timestamp, args)
+
+
+@contextlib.contextmanager
+def phase(name, args=None):
+    begin(name, args)
+    try:
+        yield
+    finally:
+        end(name)
+
+
+def write():
+    if not is_enabled():
+        return
+    with _lock:
+        events = list(_events)
+    path = os.environ['SUGARAPP_TRACE']
+    try:
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      trace_file)
+    except OSError as e:
+        _logger.error('could not write trace %s: %s', path, e)
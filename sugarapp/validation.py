@@ -0,0 +1,346 @@
+# validation.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# Lightweight checks for the files written by sugarapp.generators, covering
+# the most common desktop-file-validate and appstream-util complaints
+# without spawning external tools.
+
+import configparser
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree as ET
+
+from .generators import LICENSE_MAP
+
+
+MIME_NAMESPACE = '{http://www.freedesktop.org/standards/shared-mime-info}'
+
+SPDX_LICENSES = set(LICENSE_MAP.values()) | {
+    'AGPL-3.0-only', 'AGPL-3.0-or-later', 'Apache-2.0', 'BSD-2-Clause',
+    'BSD-3-Clause', 'CC-BY-3.0', 'CC-BY-4.0', 'CC-BY-SA-3.0',
+    'CC-BY-SA-4.0', 'CC0-1.0', 'GPL-2.0-only', 'GPL-3.0-only',
+    'LGPL-2.0-only', 'LGPL-2.1-only', 'LGPL-3.0-only', 'LGPL-3.0-or-later',
+    'MIT', 'MPL-2.0', 'OFL-1.1', 'Unlicense', 'Zlib', 'FSFAP',
+    'GFDL-1.3-or-later',
+}
+
+SPDX_EXCEPTIONS = {
+    'Autoconf-exception-3.0', 'Bison-exception-2.2',
+    'Classpath-exception-2.0', 'Font-exception-2.0', 'GCC-exception-3.1',
+    'LLVM-exception', 'OpenSSL-exception', 'Qt-LGPL-exception-1.1',
+}
+
+SPDX_OPERATORS = ['AND', 'OR', 'WITH']
+
+METADATA_LICENSES = {
+    'CC0-1.0', 'CC-BY-3.0', 'CC-BY-4.0', 'CC-BY-SA-3.0', 'CC-BY-SA-4.0',
+    'GFDL-1.1-or-later', 'GFDL-1.2-or-later', 'GFDL-1.3-or-later', 'MIT',
+    'FSFAP', 'FTL', 'BSL-1.0', '0BSD',
+}
+
+DESCRIPTION_TAGS = {'p', 'ul', 'ol', 'li', 'em', 'code'}
+
+DESKTOP_REQUIRED = ['Name', 'Type', 'Exec', 'Icon']
+DESKTOP_BOOLEANS = ['Terminal', 'StartupNotify', 'NoDisplay', 'Hidden']
+
+APPDATA_REQUIRED = [
+    'id', 'name', 'summary', 'description', 'metadata_license',
+    'project_license', 'launchable']
+
+
+class ValidationError(object):
+
+    def __init__(self, path, message, level='error'):
+        self.path = path
+        self.message = message
+        self.level = level
+
+    def __str__(self):
+        return '{}: {}'.format(self.path, self.message)
+
+    def is_error(self):
+        return self.level == 'error'
+
+    def to_dict(self):
+        return {'path': self.path, 'message': self.message,
+                'level': self.level}
+
+
+def _parse_xml(path, errors):
+    try:
+        return ET.parse(path).getroot()
+    except (ET.ParseError, OSError) as e:
+        errors.append(ValidationError(path, 'not well formed: {}'.format(e)))
+        return None
+
+
+def _parse_license(expression):
+    licenses = []
+    exceptions = []
+    depth = 0
+    expect_operand = True
+    tokens = re.findall(r'[()]|[^\s()]+', expression)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if expect_operand:
+            if token == '(':
+                depth += 1
+            elif token == ')' or token in SPDX_OPERATORS:
+                raise ValueError('unexpected {}'.format(token))
+            else:
+                licenses.append(token)
+                expect_operand = False
+                if tokens[index + 1:index + 2] == ['WITH']:
+                    exception = tokens[index + 2:index + 3]
+                    if not exception or exception[0] in ['(', ')'] or \
+                            exception[0] in SPDX_OPERATORS:
+                        raise ValueError('missing exception after WITH')
+                    exceptions += exception
+                    index += 2
+        elif token == ')' and depth:
+            depth -= 1
+        elif token in ['AND', 'OR']:
+            expect_operand = True
+        else:
+            raise ValueError('unexpected {}'.format(token))
+        index += 1
+    if expect_operand or depth:
+        raise ValueError('incomplete expression')
+    return licenses, exceptions
+
+
+def _check_license(path, expression, allowed, errors, strict=False):
+    try:
+        licenses, exceptions = _parse_license(expression)
+    except ValueError as e:
+        errors.append(ValidationError(
+            path, 'license {} is not a valid SPDX expression: {}'.format(
+                expression, e)))
+        return
+
+    # SPDX identifiers are case insensitive and only a few common ones are
+    # known here, so unknown ones are not errors unless a closed list of
+    # licenses applies.
+    known = {name.lower() for name in allowed}
+    for token in licenses:
+        name = token[:-1] if token.endswith('+') else token
+        if name.lower() in known or \
+                name.startswith(('LicenseRef-', 'DocumentRef-')):
+            continue
+        if token in LICENSE_MAP:
+            errors.append(ValidationError(
+                path, 'license {} is not a valid SPDX identifier, '
+                      'use {}'.format(token, LICENSE_MAP[token])))
+        elif strict:
+            errors.append(ValidationError(
+                path, 'license {} is not allowed here'.format(token)))
+        else:
+            errors.append(ValidationError(
+                path, 'license {} is not a known SPDX identifier'.format(
+                    token), 'warning'))
+    known = {name.lower() for name in SPDX_EXCEPTIONS}
+    for exception in exceptions:
+        if exception.lower() not in known:
+            errors.append(ValidationError(
+                path, 'license exception {} is not a known SPDX '
+                      'identifier'.format(exception), 'warning'))
+
+
+def get_mimetypes(path):
+    root = ET.parse(path).getroot()
+    return [element.get('type')
+            for element in root.iter(MIME_NAMESPACE + 'mime-type')]
+
+
+def validate_mimetypes(path):
+    errors = []
+    root = _parse_xml(path, errors)
+    if root is None:
+        return errors
+
+    if root.tag != MIME_NAMESPACE + 'mime-info':
+        errors.append(ValidationError(path, 'root element must be mime-info'))
+        return errors
+
+    mime_types = list(root.iter(MIME_NAMESPACE + 'mime-type'))
+    if not mime_types:
+        errors.append(ValidationError(path, 'no mime-type defined'))
+    for mime_type in mime_types:
+        type_name = mime_type.get('type', '')
+        if not re.match(r'^[\w.+-]+/[\w.+-]+$', type_name):
+            errors.append(ValidationError(
+                path, 'invalid mime type "{}"'.format(type_name)))
+        if mime_type.find(MIME_NAMESPACE + 'comment') is None:
+            errors.append(ValidationError(
+                path, '{} has no comment'.format(type_name)))
+        globs = mime_type.findall(MIME_NAMESPACE + 'glob')
+        if not globs:
+            errors.append(ValidationError(
+                path, '{} has no glob'.format(type_name)))
+        for glob in globs:
+            pattern = glob.get('pattern', '')
+            if not re.match(r'^\*\.[^*/\s]+$', pattern):
+                errors.append(ValidationError(
+                    path, 'unexpected glob "{}" for {}'.format(
+                        pattern, type_name)))
+    return errors
+
+
+def validate_desktop(path, mimetypes_path=None):
+    errors = []
+    section = 'Desktop Entry'
+    desktop = configparser.ConfigParser(interpolation=None)
+    desktop.optionxform = str
+    try:
+        desktop.read(path)
+    except configparser.Error as e:
+        errors.append(ValidationError(path, 'not well formed: {}'.format(e)))
+        return errors
+
+    if not desktop.has_section(section):
+        errors.append(ValidationError(path, 'missing [Desktop Entry] group'))
+        return errors
+
+    for key in DESKTOP_REQUIRED:
+        if not desktop.get(section, key, fallback=''):
+            errors.append(ValidationError(
+                path, 'required key {} is missing'.format(key)))
+
+    if desktop.get(section, 'Type', fallback='Application') != 'Application':
+        errors.append(ValidationError(path, 'Type must be Application'))
+
+    for key in DESKTOP_BOOLEANS:
+        value = desktop.get(section, key, fallback=None)
+        if value is not None and value not in ['true', 'false']:
+            errors.append(ValidationError(
+                path, '{} must be true or false, not {}'.format(key, value)))
+
+    for key in ['Categories', 'MimeType']:
+        value = desktop.get(section, key, fallback=None)
+        if value is not None and not value.endswith(';'):
+            errors.append(ValidationError(
+                path, '{} must end with a semicolon'.format(key)))
+
+    if mimetypes_path and os.path.exists(mimetypes_path):
+        declared = [value for value in desktop.get(
+            section, 'MimeType', fallback='').split(';') if value]
+        try:
+            defined = get_mimetypes(mimetypes_path)
+        except (ET.ParseError, OSError):
+            defined = []
+        for type_name in defined:
+            if type_name not in declared:
+                errors.append(ValidationError(
+                    path, 'MimeType does not list {}'.format(type_name)))
+    return errors
+
+
+def validate_appdata(path):
+    errors = []
+    root = _parse_xml(path, errors)
+    if root is None:
+        return errors
+
+    if root.tag != 'component':
+        errors.append(ValidationError(path, 'root element must be component'))
+        return errors
+    if root.get('type') != 'desktop-application':
+        errors.append(ValidationError(
+            path, 'component type must be desktop-application'))
+
+    for name in APPDATA_REQUIRED:
+        element = root.find(name)
+        if element is None or (name != 'description' and
+                               not (element.text or '').strip()):
+            errors.append(ValidationError(
+                path, 'required element {} is missing'.format(name)))
+
+    description = root.find('description')
+    if description is not None:
+        if not len(description):
+            errors.append(ValidationError(path, 'description is empty'))
+        for element in description.iter():
+            if element is not description and \
+                    element.tag not in DESCRIPTION_TAGS:
+                errors.append(ValidationError(
+                    path, 'description contains <{}>'.format(element.tag)))
+
+    project_license = root.find('project_license')
+    if project_license is not None and project_license.text:
+        _check_license(path, project_license.text, SPDX_LICENSES, errors)
+    metadata_license = root.find('metadata_license')
+    if metadata_license is not None and metadata_license.text:
+        _check_license(path, metadata_license.text, METADATA_LICENSES,
+                       errors, strict=True)
+
+    component_id = root.findtext('id', '')
+    launchable = root.findtext('launchable', '')
+    if launchable and launchable != component_id + '.desktop':
+        errors.append(ValidationError(
+            path, 'launchable {} does not match id {}'.format(
+                launchable, component_id)))
+
+    for release in root.iter('release'):
+        if not re.match(r'^\d{4}-\d{2}-\d{2}$', release.get('date', '')):
+            errors.append(ValidationError(
+                path, 'release date "{}" is not YYYY-MM-DD'.format(
+                    release.get('date', ''))))
+        if not release.get('version'):
+            errors.append(ValidationError(path, 'release without version'))
+    return errors
+
+
+def validate_bundle(output_path, bundle_id):
+    base = os.path.join(output_path, bundle_id)
+    mimetypes_path = base + '.xml'
+    errors = []
+    if os.path.exists(mimetypes_path):
+        errors += validate_mimetypes(mimetypes_path)
+    else:
+        mimetypes_path = None
+    errors += validate_appdata(base + '.appdata.xml')
+    errors += validate_desktop(base + '.desktop', mimetypes_path)
+    return errors
+
+
+def get_catalog_bundle_ids(output_path):
+    return sorted(name[:-len('.desktop')]
+                  for name in os.listdir(output_path)
+                  if name.endswith('.desktop'))
+
+
+def validate_catalog(output_path, jobs=None):
+    bundle_ids = get_catalog_bundle_ids(output_path)
+    if jobs == 1:
+        results = [validate_bundle(output_path, bundle_id)
+                   for bundle_id in bundle_ids]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                validate_bundle,
+                [output_path] * len(bundle_ids),
+                bundle_ids,
+                chunksize=max(1, len(bundle_ids) // 64)))
+    errors = []
+    for result in results:
+        errors += result
+    return errors
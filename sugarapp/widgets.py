@@ -17,28 +17,48 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import functools
+import gc
 import gi
 import json
+import logging
 import os
 import signal
-
-from xml.dom import minidom
+import threading
+import time
+import uuid
 
 gi.require_version('Gtk', '3.0')
 
 from gi.repository import Gdk
+from gi.repository import Gio
 from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 
+from sugar3 import profile
 from sugar3.activity.activity import _
 from sugar3.activity.widgets import ActivityToolbarButton
 from sugar3.datastore.datastore import DSMetadata
-from sugar3.bundle.activitybundle import get_bundle_instance
+from sugar3.graphics.alert import Alert
 from sugar3.graphics import style
 from sugar3.graphics.toolbutton import ToolButton
-
+from sugar3.graphics.xocolor import XoColor
+
+from . import autosave
+from . import fileutils
+from . import iconcache
+from . import resources
+from . import tracing
+from .bundlecache import get_bundle_info
+from .bundlecache import get_mimetypes
 from .helpers import PrimaryMonitor
+from .profiling import get_rss
+from .scheduler import FrameScheduler
+from .scheduler import TimerThrottle
+
+
+_logger = logging.getLogger()
 
 
 class SugarCompatibleWindow(Gtk.ApplicationWindow):
@@ -145,12 +165,17 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
     }
 
     def __init__(self, handle, create_jobject=True):
+        self._interrupt_source_id = None
         if hasattr(GLib, 'unix_signal_add'):
-            GLib.unix_signal_add(
-                GLib.PRIORITY_DEFAULT, signal.SIGINT, self.close)
+            self._interrupt_source_id = GLib.unix_signal_add(
+                GLib.PRIORITY_DEFAULT, signal.SIGINT, self.__interrupt_cb)
 
+        # sugar3 opens icon files directly, so the bundle icons must stay
+        # reachable from the filesystem even when resources are registered.
         icons_path = os.path.join(self._get_bundle_path(), 'icons')
         Gtk.IconTheme.get_default().append_search_path(icons_path)
+        bundle = get_bundle_info(self._get_bundle_path())
+        resources.register(self._get_bundle_path(), bundle.bundle_id)
 
         sugar_theme = 'sugar-72'
         if 'SUGAR_SCALING' in os.environ:
@@ -167,10 +192,56 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
         SugarCompatibleWindow.__init__(self)
 
         self._handle = handle
+        self._token = uuid.uuid4().hex[:8]
         self._read_file_called = False
-
-        bundle = get_bundle_instance(self._get_bundle_path())
-        self.set_icon_from_file(bundle.get_icon())
+        self._restore_generation = 0
+        self._restores_pending = 0
+
+        self._dirty = None
+        self._autosave_interval_id = None
+        self._autosave_delay = None
+        self._autosave_delay_id = None
+        self._autosave_thread = None
+        self._autosave_pending = False
+        self._history = None
+        self._busy_count = 0
+        self._frame_scheduler = None
+
+        self._active = False
+        self._on_screen = False
+        self._focused = False
+        self._iconified = False
+        self._obscured = False
+        self._inactive_since = None
+        self._memory_callbacks = []
+        self._memory_monitor = None
+        self._memory_monitor_handler = None
+        self._memory_source_id = None
+        if hasattr(Gio, 'MemoryMonitor'):
+            self._memory_monitor = Gio.MemoryMonitor.dup_default()
+            self._memory_monitor_handler = self._memory_monitor.connect(
+                'low-memory-warning', self.__low_memory_warning_cb)
+        if hasattr(GLib, 'unix_signal_add'):
+            self._memory_source_id = GLib.unix_signal_add(
+                GLib.PRIORITY_DEFAULT, signal.SIGUSR1,
+                self.__memory_pressure_signal_cb)
+
+        self._timers = TimerThrottle()
+        self._timers.set_active(False)
+        self.add_events(Gdk.EventMask.VISIBILITY_NOTIFY_MASK)
+        self.connect('notify::is-active', self.__is_active_cb)
+        self.connect('map', self.__active_state_cb)
+        self.connect('unmap', self.__active_state_cb)
+        self.connect('window-state-event', self.__window_state_event_cb)
+        self.connect('visibility-notify-event',
+                     self.__visibility_notify_event_cb)
+        self.connect('destroy', self.__destroy_cb)
+
+        pixbuf = iconcache.get_pixbuf(bundle.icon, iconcache.WINDOW_ICON_SIZE)
+        if pixbuf is not None:
+            self.set_icon(pixbuf)
+        else:
+            self.set_icon_from_file(bundle.icon)
 
         self._restore_metadata()
 
@@ -178,20 +249,107 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
         pass
 
     def iconify(self):
-        pass
+        Gtk.Window.iconify(self)
 
     def run_main_loop(self):
         pass
 
     def get_active(self):
-        return True
+        return self._active
 
     def set_active(self, active):
-        pass
+        if active == self._active:
+            return
+        self._active = active
+        self._timers.set_active(active)
+
+        if not active:
+            self._inactive_since = (time.monotonic(), time.process_time())
+        elif self._inactive_since is not None:
+            wall = time.monotonic() - self._inactive_since[0]
+            cpu = time.process_time() - self._inactive_since[1]
+            if wall > 0:
+                _logger.debug('cpu usage while inactive: %.1f%% over %.1fs',
+                              cpu * 100.0 / wall, wall)
+            self._inactive_since = None
 
     active = GObject.Property(
         type=bool, default=False, getter=get_active, setter=set_active)
 
+    def add_timer(self, interval, callback, *args, inactive_interval=0):
+        return self._timers.add(
+            interval, callback, *args, inactive_interval=inactive_interval)
+
+    def remove_timer(self, timer_id):
+        self._timers.remove(timer_id)
+
+    def get_on_screen(self):
+        return self._on_screen
+
+    on_screen = GObject.Property(
+        type=bool, default=False, getter=get_on_screen)
+
+    def _update_active(self):
+        on_screen = (self.get_mapped() and
+                     not self._iconified and
+                     not self._obscured)
+        if on_screen != self._on_screen:
+            self._on_screen = on_screen
+            self.notify('on-screen')
+        active = on_screen and self._focused
+        if active != self._active:
+            self.set_active(active)
+            self.notify('active')
+
+    def __is_active_cb(self, window, pspec):
+        self._focused = self.is_active()
+        self._update_active()
+
+    def __active_state_cb(self, widget):
+        self._update_active()
+
+    def __window_state_event_cb(self, widget, event):
+        self._iconified = bool(
+            event.new_window_state & Gdk.WindowState.ICONIFIED)
+        self._update_active()
+        return False
+
+    def __visibility_notify_event_cb(self, widget, event):
+        self._obscured = (
+            event.state == Gdk.VisibilityState.FULLY_OBSCURED)
+        self._update_active()
+        return False
+
+    def add_memory_pressure_callback(self, callback, priority=0):
+        self._memory_callbacks.append((priority, callback))
+        self._memory_callbacks.sort(key=lambda item: item[0])
+
+    def remove_memory_pressure_callback(self, callback):
+        self._memory_callbacks = [
+            item for item in self._memory_callbacks if item[1] != callback]
+
+    def handle_memory_pressure(self, level=0):
+        rss_before = get_rss()
+        self._autosave()
+        for priority, callback in list(self._memory_callbacks):
+            try:
+                callback(level)
+            except Exception as e:
+                _logger.error('memory pressure callback failed: %s', e)
+        gc.collect()
+        rss_after = get_rss()
+        if rss_before is not None and rss_after is not None:
+            _logger.info('memory pressure %d: rss %d KiB -> %d KiB', level,
+                         rss_before // 1024, rss_after // 1024)
+        return rss_before, rss_after
+
+    def __low_memory_warning_cb(self, monitor, level):
+        self.handle_memory_pressure(int(level))
+
+    def __memory_pressure_signal_cb(self):
+        self.handle_memory_pressure()
+        return True
+
     def get_max_participants(self):
         return 1
 
@@ -215,9 +373,16 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
         SugarCompatibleWindow.set_canvas(self, canvas)
         if not self._read_file_called:
             canvas.connect('map', self.__canvas_map_cb)
+        if 'SUGARAPP_FPS_OVERLAY' in os.environ and canvas:
+            self.get_frame_scheduler().enable_overlay(canvas)
 
     canvas = property(get_canvas, set_canvas)
 
+    def get_frame_scheduler(self):
+        if self._frame_scheduler is None:
+            self._frame_scheduler = FrameScheduler(self)
+        return self._frame_scheduler
+
     def get_activity_root(self):
         return os.environ['SUGAR_ACTIVITY_ROOT']
 
@@ -227,14 +392,189 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
     def write_file(self, file_path):
         raise NotImplementedError
 
+    def read_stream(self, stream):
+        raise NotImplementedError
+
+    def write_stream(self, stream):
+        raise NotImplementedError
+
+    def read_document(self, gfile, cancellable=None):
+        if not self._implements('read_stream'):
+            self.read_file(gfile.get_path())
+            return
+        stream = gfile.read(cancellable)
+        try:
+            self.read_stream(stream)
+        finally:
+            stream.close(None)
+
+    def write_document(self, gfile, cancellable=None):
+        if not self._implements('write_stream'):
+            self.write_file(gfile.get_path())
+            return
+        stream = gfile.replace(
+            None, False, Gio.FileCreateFlags.NONE, cancellable)
+        # closing with a cancelled cancellable discards the new contents
+        # and keeps the destination as it was
+        try:
+            self.write_stream(stream)
+        except Exception:
+            abort = Gio.Cancellable()
+            abort.cancel()
+            try:
+                stream.close(abort)
+            except GLib.Error:
+                pass
+            raise
+        stream.close(cancellable)
+
+    def read_document_async(self, gfile, callback=None, cancellable=None):
+        if self._implements('parse_file'):
+            self._wait_autosave()
+            self._restore_async(gfile.get_path(), callback, cancellable)
+            return
+        if self._implements('read_stream'):
+            self._wait_autosave()
+            self._restores_pending += 1
+            self._run_async(
+                self.read_document, gfile,
+                functools.partial(self.__read_document_done_cb, callback),
+                cancellable)
+            return
+
+        # read_file updates the widgets, so it can only run here
+        error = None
+        try:
+            self.read_file(gfile.get_path())
+        except Exception as e:
+            error = e
+        if callback is not None:
+            callback(gfile, error)
+
+    def write_document_async(self, gfile, callback=None, cancellable=None):
+        snapshot = self.get_autosave_snapshot()
+        if snapshot is None and self._implements('write_stream'):
+            self._run_async(self.write_document, gfile, callback, cancellable)
+            return
+
+        # write_file reads the widgets, so it runs here and only committing
+        # the file is left to the worker
+        temp_path = fileutils.get_temp_path(gfile.get_path())
+        error = None
+        if snapshot is None:
+            try:
+                self.write_file(temp_path)
+            except Exception as e:
+                error = e
+        self._run_async(
+            functools.partial(
+                self.__commit_document, snapshot, temp_path, error),
+            gfile, callback, cancellable)
+
+    def parse_file(self, file_path):
+        raise NotImplementedError
+
+    def read_data(self, data):
+        raise NotImplementedError
+
+    def restore_file(self, file_path=None):
+        self._wait_autosave()
+        if not self._implements('parse_file'):
+            self.__restore(file_path)
+            return
+
+        self._restore_async(file_path, None, None)
+
+    def _restore_async(self, file_path, callback, cancellable):
+        # workers can finish out of order, only the latest request applies
+        self._restore_generation += 1
+        self._restores_pending += 1
+        temp_path = self._get_autosave_temp_filename(
+            'restore-%d' % self._restore_generation)
+        self.busy()
+        tracing.begin('restore')
+        thread = threading.Thread(
+            target=self.__restore_worker,
+            args=(file_path, temp_path, self._restore_generation,
+                  callback, cancellable),
+            daemon=True)
+        thread.start()
+
     def notify_user(self, summary, body):
         pass
 
     def save(self):
+        # until the document is loaded there is nothing to save, and
+        # writing now would replace the one being restored
+        if self._restores_pending:
+            _logger.debug('not saving while a restore is pending')
+            return
+        self._wait_autosave()
+        temp_path = self._get_autosave_temp_filename()
         try:
-            self.write_file(self._get_autosave_filename())
+            self.write_document(Gio.File.new_for_path(temp_path))
         except NotImplementedError:
-            pass
+            return
+        if os.path.exists(temp_path):
+            self._commit_autosave(temp_path)
+        if self._dirty is not None:
+            self._dirty = False
+
+    def enable_autosave(self, interval=60, delay=2):
+        self.disable_autosave()
+        self._autosave_delay = delay
+        if interval:
+            self._autosave_interval_id = GLib.timeout_add_seconds(
+                interval, self.__autosave_interval_cb)
+
+    def disable_autosave(self):
+        if self._autosave_interval_id is not None:
+            GLib.source_remove(self._autosave_interval_id)
+            self._autosave_interval_id = None
+        if self._autosave_delay_id is not None:
+            GLib.source_remove(self._autosave_delay_id)
+            self._autosave_delay_id = None
+        self._autosave_delay = None
+
+    def enable_autosave_history(self, max_versions=5):
+        root = GLib.build_filenamev([
+            GLib.get_user_data_dir(), self._get_document_name('snapshots')])
+        self._history = autosave.SnapshotStore(root, max_versions)
+
+    def get_autosave_versions(self):
+        if self._history is None:
+            return []
+        return self._history.get_versions()
+
+    def restore_autosave_version(self, version):
+        self._wait_autosave()
+        file_path = self._get_autosave_temp_filename('restore')
+        self._history.restore(version, file_path)
+        try:
+            self.read_document(Gio.File.new_for_path(file_path))
+        finally:
+            fileutils.discard_file(file_path)
+
+    def mark_dirty(self):
+        self._dirty = True
+        if self._autosave_delay is None:
+            return
+        if self._autosave_delay_id is not None:
+            GLib.source_remove(self._autosave_delay_id)
+        self._autosave_delay_id = GLib.timeout_add_seconds(
+            self._autosave_delay, self.__autosave_delay_cb)
+
+    def mark_clean(self):
+        self._dirty = False
+
+    def is_dirty(self):
+        return self._dirty is not False
+
+    def get_autosave_snapshot(self):
+        return None
+
+    def write_snapshot(self, snapshot, file_path):
+        raise NotImplementedError
 
     def get_shared_activity(self):
         return None
@@ -255,10 +595,35 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
 
     def close(self, skip_save=False):
         self.can_close()
+        self._remove_sources()
+        self.disable_autosave()
+        if self._frame_scheduler is not None:
+            _logger.debug('frame stats: %s', self._frame_scheduler.get_stats())
         self.save()
         self._save_metadata()
         self.emit('closing')
 
+    def _remove_sources(self):
+        # closed windows may stay alive while others remain open, they
+        # must not react to signals meant for the running ones
+        if self._interrupt_source_id is not None:
+            GLib.source_remove(self._interrupt_source_id)
+            self._interrupt_source_id = None
+        if self._memory_source_id is not None:
+            GLib.source_remove(self._memory_source_id)
+            self._memory_source_id = None
+        if self._memory_monitor_handler is not None:
+            self._memory_monitor.disconnect(self._memory_monitor_handler)
+            self._memory_monitor_handler = None
+
+    def __destroy_cb(self, widget):
+        self._remove_sources()
+
+    def __interrupt_cb(self):
+        self._interrupt_source_id = None
+        self.close()
+        return GLib.SOURCE_REMOVE
+
     def __delete_event_cb(self, widget, event):
         self.close()
         return True
@@ -278,45 +643,83 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
         pass
 
     def busy(self):
-        pass
+        if self._busy_count == 0:
+            window = self.get_window()
+            if window is not None:
+                cursor = Gdk.Cursor.new_from_name(window.get_display(), 'wait')
+                window.set_cursor(cursor)
+        self._busy_count += 1
+        return self._busy_count
 
     def unbusy(self):
-        pass
+        if self._busy_count == 0:
+            return 0
+        self._busy_count -= 1
+        if self._busy_count == 0:
+            window = self.get_window()
+            if window is not None:
+                window.set_cursor(None)
+        return self._busy_count
 
     def get_filename_suffix(self):
+        return self.get_mimetypes().get_suffix()
+
+    def get_mimetypes(self):
         filepath = os.path.join(
             self._get_bundle_path(),
             'activity',
             'mimetypes.xml')
-        if not os.path.exists(filepath):
-            return ''
-
-        xml = minidom.parse(filepath)
-        items = xml.getElementsByTagName('glob')
-        if not items:
-            return ''
-
-        pattern = items[0].attributes['pattern'].value
-        return pattern.replace('*', '')
+        return get_mimetypes(filepath)
 
     def _get_bundle_path(self):
         return os.environ['SUGAR_BUNDLE_PATH']
 
-    def _get_autosave_filename(self):
-        return GLib.build_filenamev([GLib.get_user_data_dir(), 'autosave'])
+    def _get_document_name(self, name):
+        if self.get_id() != self.get_bundle_id():
+            name = '%s-%s' % (name, self.get_id())
+        return name
 
-    def _get_preferred_filename(self):
+    def _get_autosave_filename(self):
+        return GLib.build_filenamev([
+            GLib.get_user_data_dir(), self._get_document_name('autosave')])
+
+    def _get_autosave_temp_filename(self, kind='tmp'):
+        filename = self._get_autosave_filename()
+        if self._history is not None:
+            filename = GLib.build_filenamev([
+                GLib.get_user_runtime_dir(),
+                'sugarapp-%s' % self._get_document_name(
+                    self.get_bundle_id() + '-autosave')])
+        # windows of the same process must never share a temporary file,
+        # and restores must not use the one autosave commits and deletes
+        return '%s.%d.%s.%s' % (filename, os.getpid(), self._token, kind)
+
+    def _get_preferred_filename(self, temp_path):
         if self._handle.uri:
             return self._handle.uri
+        if self._history is not None:
+            version = self._history.get_latest()
+            if version is not None:
+                self._history.restore(version, temp_path)
+                return temp_path
         return self._get_autosave_filename()
 
+    def _commit_autosave(self, temp_path):
+        if self._history is None:
+            fileutils.commit_file(temp_path, self._get_autosave_filename())
+            return
+        try:
+            version, written = self._history.add(temp_path)
+            _logger.debug('autosave %s wrote %d bytes', version, written)
+        finally:
+            fileutils.discard_file(temp_path)
+
     def _save_metadata(self):
         if not self._metadata:
             return
         metadata_path = self._get_autosave_filename() + '.metadata'
-        with open(metadata_path, 'w') as metadata_file:
-            properties = self._metadata.get_dictionary()
-            metadata_file.write(json.dumps(properties))
+        properties = self._metadata.get_dictionary()
+        fileutils.write_file(metadata_path, json.dumps(properties))
 
     def _restore_metadata(self):
         properties = {}
@@ -330,13 +733,175 @@ class SugarCompatibleActivity(SugarCompatibleWindow, Gtk.Container):
             properties['title'] = ''
         self._metadata = DSMetadata(properties)
 
-    def __canvas_map_cb(self, canvas):
+    def _autosave(self):
+        if not self.is_dirty() or self._restores_pending:
+            return
+        if self._autosave_thread is not None:
+            self._autosave_pending = True
+            return
+
+        filename = self._get_autosave_filename()
+        temp_path = self._get_autosave_temp_filename()
+        snapshot = self.get_autosave_snapshot()
+        if snapshot is None:
+            try:
+                self.write_document(Gio.File.new_for_path(temp_path))
+            except NotImplementedError:
+                return
+        properties = None
+        if self._metadata:
+            properties = dict(self._metadata.get_dictionary())
+        if self._dirty is not None:
+            self._dirty = False
+
+        self._autosave_thread = threading.Thread(
+            target=self.__autosave_worker,
+            args=(snapshot, properties, temp_path, filename),
+            daemon=True)
+        self._autosave_thread.start()
+
+    def _wait_autosave(self):
+        if self._autosave_thread is not None:
+            self._autosave_thread.join()
+            self._autosave_thread = None
+        self._autosave_pending = False
+
+    def __autosave_worker(self, snapshot, properties, temp_path, filename):
+        try:
+            if snapshot is not None:
+                self.write_snapshot(snapshot, temp_path)
+            if os.path.exists(temp_path):
+                self._commit_autosave(temp_path)
+            if properties is not None:
+                fileutils.write_file(
+                    filename + '.metadata', json.dumps(properties))
+        except Exception as e:
+            _logger.error('autosave failed: %s', e)
+            fileutils.discard_file(temp_path)
+        GLib.idle_add(self.__autosave_done_cb)
+
+    def __autosave_done_cb(self):
+        if self._autosave_thread is None:
+            return False
+        self._autosave_thread.join()
+        self._autosave_thread = None
+        if self._autosave_pending:
+            self._autosave_pending = False
+            self._autosave()
+        return False
+
+    def __autosave_interval_cb(self):
+        self._autosave()
+        return True
+
+    def __autosave_delay_cb(self):
+        self._autosave_delay_id = None
+        self._autosave()
+        return False
+
+    def _implements(self, name):
+        method = getattr(type(self), name)
+        return method is not getattr(SugarCompatibleActivity, name)
+
+    def _run_async(self, function, gfile, callback, cancellable):
+        self.busy()
+        thread = threading.Thread(
+            target=self.__run_async_worker,
+            args=(function, gfile, callback, cancellable),
+            daemon=True)
+        thread.start()
+
+    def __commit_document(self, snapshot, temp_path, error, gfile,
+                          cancellable):
         try:
-            self.read_file(self._get_preferred_filename())
+            if error is not None:
+                raise error
+            if snapshot is not None:
+                self.write_snapshot(snapshot, temp_path)
+            if cancellable is not None:
+                cancellable.set_error_if_cancelled()
+            fileutils.commit_file(temp_path, gfile.get_path())
         except Exception:
-            pass
+            fileutils.discard_file(temp_path)
+            raise
+
+    def __run_async_worker(self, function, gfile, callback, cancellable):
+        error = None
+        try:
+            if cancellable is not None:
+                cancellable.set_error_if_cancelled()
+            function(gfile, cancellable)
+        except Exception as e:
+            error = e
+        GLib.idle_add(self.__run_async_done_cb, gfile, error, callback)
+
+    def __run_async_done_cb(self, gfile, error, callback):
+        self.unbusy()
+        if error is not None:
+            _logger.error('could not access %s: %s', gfile.get_uri(), error)
+        if callback is not None:
+            callback(gfile, error)
+        return False
+
+    def __restore(self, file_path):
+        temp_path = self._get_autosave_temp_filename('restore')
+        try:
+            with tracing.phase('restore'):
+                if file_path is None:
+                    file_path = self._get_preferred_filename(temp_path)
+                self.read_document(Gio.File.new_for_path(file_path))
+        except Exception as e:
+            _logger.debug('could not restore %s: %s', file_path, e)
+        fileutils.discard_file(temp_path)
+        tracing.write()
+
+    def __restore_worker(self, file_path, temp_path, generation, callback,
+                         cancellable):
+        data = None
+        error = None
+        try:
+            if cancellable is not None:
+                cancellable.set_error_if_cancelled()
+            if file_path is None:
+                file_path = self._get_preferred_filename(temp_path)
+            data = self.parse_file(file_path)
+            if cancellable is not None:
+                cancellable.set_error_if_cancelled()
+        except Exception as e:
+            error = e
+        fileutils.discard_file(temp_path)
+        GLib.idle_add(
+            self.__restore_done_cb, file_path, data, error, generation,
+            callback)
+
+    def __restore_done_cb(self, file_path, data, error, generation,
+                          callback):
+        self._restores_pending -= 1
+        if generation != self._restore_generation:
+            _logger.debug('discarding stale restore of %s', file_path)
+        elif error is None:
+            try:
+                self.read_data(data)
+            except Exception as e:
+                error = e
+        if error is not None:
+            _logger.debug('could not restore %s: %s', file_path, error)
+        tracing.end('restore')
+        self.unbusy()
+        tracing.write()
+        if callback is not None:
+            callback(Gio.File.new_for_path(file_path), error)
+        return False
+
+    def __read_document_done_cb(self, callback, gfile, error):
+        self._restores_pending -= 1
+        if callback is not None:
+            callback(gfile, error)
+
+    def __canvas_map_cb(self, canvas):
         self._read_file_called = True
         canvas.disconnect_by_func(self.__canvas_map_cb)
+        self.restore_file()
 
 
 class ExtendedActivityToolbarButton(ActivityToolbarButton):
@@ -346,17 +911,48 @@ class ExtendedActivityToolbarButton(ActivityToolbarButton):
     def __init__(self, activity):
         ActivityToolbarButton.__init__(self, activity)
         self._activity = activity
+        self._chooser = None
+        self.__setup_activity_icon()
         GLib.idle_add(self.__setup_buttons_cb)
 
+    def __setup_activity_icon(self):
+        color = profile.get_color()
+        metadata = self._activity.metadata
+        if metadata is not None and metadata.get('icon-color'):
+            color = XoColor(metadata['icon-color'])
+        bundle = get_bundle_info(os.environ['SUGAR_BUNDLE_PATH'])
+        icon = iconcache.create_image(
+            bundle.icon, style.STANDARD_ICON_SIZE,
+            PrimaryMonitor.get_scale_factor(),
+            color.get_fill_color(), color.get_stroke_color())
+        if icon is not None:
+            self.set_icon_widget(icon)
+            icon.show()
+
+    def _create_button(self, icon_name):
+        icon = None
+        path = iconcache.lookup_icon(icon_name, style.STANDARD_ICON_SIZE)
+        if path is not None:
+            icon = iconcache.create_image(
+                path, style.STANDARD_ICON_SIZE,
+                PrimaryMonitor.get_scale_factor())
+        if icon is None:
+            return ToolButton(icon_name=icon_name)
+
+        button = ToolButton()
+        button.set_icon_widget(icon)
+        icon.show()
+        return button
+
     def __setup_buttons_cb(self):
-        save_button = ToolButton(icon_name='document-save')
+        save_button = self._create_button('document-save')
         save_button.props.tooltip = _("Save")
         save_button.connect('clicked', self.__save_clicked_cb)
         save_button.show()
         save_button.set_sensitive(True)
         self.page.insert(save_button, -1)
 
-        open_button = ToolButton(icon_name='document-open')
+        open_button = self._create_button('document-open')
         open_button.props.tooltip = _("Open")
         open_button.connect('clicked', self.__open_clicked_cb)
         open_button.show()
@@ -364,20 +960,72 @@ class ExtendedActivityToolbarButton(ActivityToolbarButton):
         self.page.insert(open_button, -1)
 
     def __save_clicked_cb(self, widget):
-        suffix = self._activity.get_filename_suffix()
-        filename = _('Untitled') + suffix
+        mimetypes = self._activity.get_mimetypes()
+        filename = _('Untitled') + mimetypes.get_suffix()
         chooser = DesktopSaveChooser(self._activity, filename=filename)
-        chooser.add_filter(suffix, _("Default"))
-        filename = chooser.get_filename()
-        if filename:
-            self._activity.write_file(filename)
+        chooser.add_mimetypes_filters(mimetypes)
+        chooser.get_filename_async(self.__save_response_cb)
+        self._chooser = chooser
+
+    def __save_response_cb(self, filename):
+        self._chooser = None
+        if not filename:
+            return
+        self._run_with_alert(
+            filename, _('Saving'), _('Could not save'),
+            self._activity.write_document_async)
+
+    def _run_with_alert(self, filename, title, error_title, function):
+        cancellable = Gio.Cancellable()
+        alert = Alert()
+        alert.props.title = title
+        alert.props.msg = os.path.basename(filename)
+        alert.add_button(Gtk.ResponseType.CANCEL, _('Cancel'))
+        alert.connect('response', self.__alert_response_cb, cancellable)
+        self._activity.add_alert(alert)
+        alert.show()
+
+        progress_id = GLib.timeout_add_seconds(
+            1, self.__progress_cb, alert, filename, time.monotonic())
+        function(
+            Gio.File.new_for_path(filename),
+            functools.partial(self.__done_cb, alert, progress_id, error_title),
+            cancellable)
+
+    def __progress_cb(self, alert, filename, start):
+        alert.props.msg = _('%s, %d seconds') % (
+            os.path.basename(filename), time.monotonic() - start)
+        return True
+
+    def __done_cb(self, alert, progress_id, error_title, gfile, error):
+        GLib.source_remove(progress_id)
+        cancelled = isinstance(error, GLib.Error) and error.matches(
+            Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED)
+        if error is None or cancelled:
+            self._activity.remove_alert(alert)
+            return
+        alert.props.title = error_title
+        alert.props.msg = '%s: %s' % (gfile.get_basename(), error)
+        alert.remove_button(Gtk.ResponseType.CANCEL)
+        alert.add_button(Gtk.ResponseType.OK, _('Ok'))
+
+    def __alert_response_cb(self, alert, response_id, cancellable):
+        cancellable.cancel()
+        self._activity.remove_alert(alert)
 
     def __open_clicked_cb(self, widget):
         chooser = DesktopOpenChooser(self._activity)
-        chooser.add_filter(self._activity.get_filename_suffix(), _("Default"))
-        filename = chooser.get_filename()
-        if filename:
-            self._activity.read_file(filename)
+        chooser.add_mimetypes_filters(self._activity.get_mimetypes())
+        chooser.get_filename_async(self.__open_response_cb)
+        self._chooser = chooser
+
+    def __open_response_cb(self, filename):
+        self._chooser = None
+        if not filename:
+            return
+        self._run_with_alert(
+            filename, _('Opening'), _('Could not open'),
+            self._activity.read_document_async)
 
 
 class DesktopOpenChooser(object):
@@ -393,6 +1041,18 @@ class DesktopOpenChooser(object):
             return None
         return self._chooser.get_filename()
 
+    def get_filename_async(self, callback):
+        self._chooser.connect('response', self.__response_cb, callback)
+        self._chooser.show()
+
+    def __response_cb(self, chooser, response_id, callback):
+        chooser.disconnect_by_func(self.__response_cb)
+        filename = None
+        if response_id == Gtk.ResponseType.ACCEPT:
+            filename = chooser.get_filename()
+        chooser.destroy()
+        callback(filename)
+
     def add_filter(self, suffix, name):
         if not suffix:
             return
@@ -401,6 +1061,16 @@ class DesktopOpenChooser(object):
         file_filter.set_name(name)
         self._chooser.add_filter(file_filter)
 
+    def add_mimetypes_filters(self, mimetypes):
+        for mime_type in mimetypes.types:
+            if not mime_type['globs']:
+                continue
+            file_filter = Gtk.FileFilter()
+            for pattern in mime_type['globs']:
+                file_filter.add_pattern(pattern)
+            file_filter.set_name(mime_type['comment'] or _("Default"))
+            self._chooser.add_filter(file_filter)
+
     def _setup_chooser(self):
         self._chooser = Gtk.FileChooserNative.new(
             None,
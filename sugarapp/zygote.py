@@ -0,0 +1,319 @@
+# zygote.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+# This module is imported by the launcher before anything else, so it must
+# not import gi, Gtk or sugar3 at the top level.
+
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+import time
+
+
+_logger = logging.getLogger()
+
+_MAX_MESSAGE = 1024 * 1024
+
+# Variables read by the preloaded modules at import time, children with
+# different values must not reuse them.
+_PRELOAD_ENV = [
+    'SUGAR_SCALING',
+    'LANG',
+    'LANGUAGE',
+    'XDG_CACHE_HOME',
+    'XDG_CONFIG_DIRS',
+    'XDG_CONFIG_HOME',
+    'XDG_DATA_DIRS',
+    'XDG_DATA_HOME',
+    'XDG_RUNTIME_DIR']
+
+_environment = None
+
+
+def get_socket_path():
+    if 'SUGARAPP_ZYGOTE_SOCKET' in os.environ:
+        return os.environ['SUGARAPP_ZYGOTE_SOCKET']
+    # A shared directory like /tmp would let other users impersonate the
+    # zygote, so there is no fallback.
+    if not os.environ.get('XDG_RUNTIME_DIR'):
+        return None
+    return os.path.join(os.environ['XDG_RUNTIME_DIR'], 'sugarapp-zygote')
+
+
+def _is_private(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return False
+    return info.st_uid == os.getuid() and not info.st_mode & 0o077
+
+
+def _is_trusted(path):
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and \
+        info.st_uid == os.getuid() and \
+        _is_private(os.path.dirname(os.path.abspath(path)))
+
+
+def _get_peer_uid(conn):
+    credentials = conn.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', credentials)
+    return uid
+
+
+def _send_message(conn, message, fds=None):
+    data = json.dumps(message).encode('utf-8')
+    header = struct.pack('!I', len(data))
+    if fds:
+        # the descriptors travel with the header, the rest may need more
+        # than one send
+        if socket.send_fds(conn, [header], fds) != len(header):
+            raise OSError('short send')
+    else:
+        conn.sendall(header)
+    conn.sendall(data)
+
+
+def _recv_exact(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise OSError('connection closed')
+        data += chunk
+    return data
+
+
+def _recv_message(conn, maxfds=0):
+    header_size = struct.calcsize('!I')
+    fds = []
+    if maxfds:
+        data, fds, flags, address = socket.recv_fds(
+            conn, header_size, maxfds)
+        if not data:
+            raise OSError('connection closed')
+        data += _recv_exact(conn, header_size - len(data))
+    else:
+        data = _recv_exact(conn, header_size)
+    size = struct.unpack('!I', data)[0]
+    if size > _MAX_MESSAGE:
+        raise OSError('message too large')
+    return json.loads(_recv_exact(conn, size).decode('utf-8')), fds
+
+
+def _get_environment(environ):
+    return {name: value for name, value in environ.items()
+            if name in _PRELOAD_ENV or name.startswith('LC_')}
+
+
+def set_launch_time(mode, environ=os.environ):
+    if 'SUGARAPP_LAUNCH_TIME' not in environ:
+        environ['SUGARAPP_LAUNCH_TIME'] = repr(time.monotonic())
+    environ['SUGARAPP_LAUNCH_MODE'] = mode
+
+
+def launch(argv):
+    path = get_socket_path()
+    if path is None or not _is_trusted(path):
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        if _get_peer_uid(conn) != os.getuid():
+            conn.close()
+            return None
+    except OSError:
+        conn.close()
+        return None
+
+    environ = dict(os.environ)
+    set_launch_time('zygote', environ)
+    request = {
+        'argv': argv,
+        'env': environ,
+        'cwd': os.getcwd(),
+    }
+
+    try:
+        _send_message(conn, request, [0, 1, 2])
+        reply, fds = _recv_message(conn)
+    except (OSError, ValueError):
+        conn.close()
+        return None
+
+    pid = reply.get('pid')
+    if pid is None:
+        conn.close()
+        return None
+
+    def forward(signum, frame):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    for signum in [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]:
+        signal.signal(signum, forward)
+
+    try:
+        status = _recv_message(conn)[0]['status']
+    except (OSError, ValueError, KeyError):
+        status = 1
+    conn.close()
+    return status
+
+
+def serve():
+    global _environment
+
+    # Keep Gtk from connecting to the display at import time, every
+    # forked child must open its own connection.
+    for name in ['DISPLAY', 'WAYLAND_DISPLAY']:
+        os.environ.pop(name, None)
+    _environment = _get_environment(os.environ)
+
+    from sugarapp import logs
+    logging.basicConfig(format=logs.FORMAT, level=logging.INFO)
+
+    # Preload the expensive part of the stack, so forked children only
+    # pay for the bundle itself.
+    from sugar3.activity import activity  # noqa: F401
+    from sugar3.activity import widgets  # noqa: F401
+    from sugar3.graphics import alert  # noqa: F401
+    from sugar3.graphics import icon  # noqa: F401
+    from sugar3.graphics import style  # noqa: F401
+    from sugar3.graphics import toolbarbox  # noqa: F401
+    from sugar3.graphics import toolbutton  # noqa: F401
+    from sugarapp import widgets  # noqa: F401
+    from sugarapp import application
+
+    path = get_socket_path()
+    if path is None:
+        _logger.error('XDG_RUNTIME_DIR or SUGARAPP_ZYGOTE_SOCKET '
+                      'must be set to run the zygote')
+        sys.exit(1)
+    if not _is_private(os.path.dirname(os.path.abspath(path))):
+        _logger.error('%s must be in a directory only '
+                      'accessible by its owner', path)
+        sys.exit(1)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    server.bind(path)
+    os.umask(old_umask)
+    server.listen(8)
+
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    _logger.info('zygote listening on %s', path)
+
+    try:
+        while True:
+            conn, address = server.accept()
+            if _get_peer_uid(conn) != os.getuid():
+                conn.close()
+                continue
+            if os.fork() == 0:
+                server.close()
+                _handle(conn, application)
+            conn.close()
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+def _handle(conn, application):
+    status = 1
+    try:
+        request, fds = _recv_message(conn, 3)
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            raise OSError('expected the standard streams')
+        if _get_environment(request['env']) != _environment:
+            for fd in fds:
+                os.close(fd)
+            # the launcher falls back to a direct start
+            _send_message(conn, {'pid': None})
+            return
+
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            _run(request, fds, application)
+
+        for fd in fds:
+            os.close(fd)
+        _send_message(conn, {'pid': pid})
+        pid, wait_status = os.waitpid(pid, 0)
+        status = os.waitstatus_to_exitcode(wait_status)
+        _send_message(conn, {'status': status})
+    except Exception as e:
+        _logger.error('zygote request failed: %s', e)
+    finally:
+        conn.close()
+        os._exit(0)
+
+
+def _run(request, fds, application):
+    status = 1
+    try:
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # the application sets up its own logging
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        os.environ.clear()
+        os.environ.update(request['env'])
+        os.chdir(request['cwd'])
+        sys.argv = request['argv']
+
+        if 'SUGARAPP_IMPORT_REPORT' in os.environ:
+            from sugarapp import importer
+            importer.start_report()
+        status = application.main()
+    except SystemExit as e:
+        status = e.code
+    except BaseException:
+        sys.excepthook(*sys.exc_info())
+    finally:
+        # os._exit() skips atexit, which drains the log queue
+        from sugarapp import logs
+        logs.shutdown()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status if isinstance(status, int) else 1)
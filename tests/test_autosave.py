@@ -0,0 +1,69 @@
+# test_autosave.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import os
+
+from sugarapp.autosave import SnapshotStore
+
+
+def _count_chunks(root):
+    return sum(len(names) for _, _, names in os.walk(root / 'chunks'))
+
+
+def test_add_and_restore(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'store'))
+    document = tmp_path / 'document'
+    data = os.urandom(SnapshotStore.CHUNK_SIZE * 2 + 10)
+    document.write_bytes(data)
+
+    version, written = store.add(str(document))
+    assert written > 0
+    assert store.get_latest() == version
+
+    # unchanged chunks are not stored twice
+    second_version, written = store.add(str(document))
+    assert written < SnapshotStore.CHUNK_SIZE
+    assert _count_chunks(tmp_path / 'store') == 3
+
+    restored = tmp_path / 'restored'
+    store.restore(second_version, str(restored))
+    assert restored.read_bytes() == data
+    assert sorted(os.listdir(str(tmp_path))) == \
+        ['document', 'restored', 'store']
+
+
+def test_evict_old_versions(tmp_path):
+    root = tmp_path / 'store'
+    store = SnapshotStore(str(root), max_versions=2)
+    document = tmp_path / 'document'
+
+    contents = [b'first', b'second', b'third']
+    for data in contents:
+        document.write_bytes(data)
+        store.add(str(document))
+
+    versions = store.get_versions()
+    assert len(versions) == 2
+    assert _count_chunks(root) == 2
+
+    for version, data in zip(versions, contents[1:]):
+        restored = tmp_path / 'restored'
+        store.restore(version, str(restored))
+        assert restored.read_bytes() == data
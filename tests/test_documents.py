@@ -0,0 +1,49 @@
+# test_documents.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import pytest
+
+pytest.importorskip('gi')
+pytest.importorskip('sugar3')
+
+from gi.repository import Gio  # noqa: E402
+
+from sugarapp.widgets import SugarCompatibleActivity  # noqa: E402
+
+
+class _FailingDocument(object):
+
+    def _implements(self, name):
+        return True
+
+    def write_stream(self, stream):
+        stream.write_all(b'partial', None)
+        raise IOError('disk full')
+
+
+def test_failed_write_keeps_destination(tmp_path):
+    path = tmp_path / 'document'
+    path.write_bytes(b'original')
+
+    with pytest.raises(IOError):
+        SugarCompatibleActivity.write_document(
+            _FailingDocument(), Gio.File.new_for_path(str(path)))
+
+    assert path.read_bytes() == b'original'
+    assert [entry.name for entry in tmp_path.iterdir()] == ['document']
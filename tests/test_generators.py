@@ -0,0 +1,103 @@
+# test_generators.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import os
+
+from sugarapp.generators import generate_bundle
+
+
+ACTIVITY_INFO = """[Activity]
+name = Example
+activity_version = 1
+bundle_id = org.sugarlabs.Example
+exec = sugar-activity3 activity.ExampleActivity
+icon = activity-example
+license = GPLv3+
+metadata_license = CC0-1.0
+summary = Example activity
+description = {description}
+tags = Utility
+update_contact = example@sugarlabs.org
+release_date = 2019-01-01
+developer_name = Sugar Labs
+developer_id = org.sugarlabs
+url = https://github.com/tchx84/sugarapp
+repository_url = https://github.com/tchx84/sugarapp
+"""
+
+OUTPUTS = [
+    'org.sugarlabs.Example.xml',
+    'org.sugarlabs.Example.appdata.xml',
+    'org.sugarlabs.Example.desktop',
+]
+
+OLD_TIME = 1000000000
+
+
+def _write_bundle(tmp_path, description):
+    activity_path = tmp_path / 'Example.activity' / 'activity'
+    activity_path.mkdir(parents=True, exist_ok=True)
+    (activity_path / 'activity.info').write_text(
+        ACTIVITY_INFO.format(description=description))
+    return str(tmp_path / 'Example.activity')
+
+
+def _age_outputs(output_path):
+    for name in os.listdir(output_path):
+        os.utime(os.path.join(output_path, name), (OLD_TIME, OLD_TIME))
+
+
+def _get_mtimes(output_path):
+    return {name: os.stat(os.path.join(output_path, name)).st_mtime
+            for name in OUTPUTS}
+
+
+def test_incremental_skips_up_to_date(tmp_path):
+    bundle_path = _write_bundle(tmp_path, 'Does nothing.')
+    output_path = tmp_path / 'output'
+    output_path.mkdir()
+
+    generate_bundle(bundle_path, str(output_path), incremental=True)
+    for name in OUTPUTS:
+        assert (output_path / (name + '.hash')).exists()
+    _age_outputs(str(output_path))
+
+    generate_bundle(bundle_path, str(output_path), incremental=True)
+    assert set(_get_mtimes(str(output_path)).values()) == {OLD_TIME}
+
+
+def test_incremental_keeps_unchanged_mtime(tmp_path):
+    bundle_path = _write_bundle(tmp_path, 'Does nothing.')
+    output_path = tmp_path / 'output'
+    output_path.mkdir()
+
+    generate_bundle(bundle_path, str(output_path), incremental=True)
+    _age_outputs(str(output_path))
+
+    # only the appdata file mentions the description, the other outputs
+    # are regenerated with the same contents and must keep their mtime
+    _write_bundle(tmp_path, 'Does nothing, quickly.')
+    generate_bundle(bundle_path, str(output_path), incremental=True)
+
+    mtimes = _get_mtimes(str(output_path))
+    assert mtimes.pop('org.sugarlabs.Example.appdata.xml') != OLD_TIME
+    assert set(mtimes.values()) == {OLD_TIME}
+    assert 'quickly' in \
+        (output_path / 'org.sugarlabs.Example.appdata.xml').read_text()
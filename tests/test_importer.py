@@ -0,0 +1,43 @@
+# test_importer.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from sugarapp import importer
+
+
+def test_build_index(tmp_path):
+    for path in ['main.py', 'setup.py', 'bad-name.py', 'notes.txt',
+                 'widgets/__init__.py', 'widgets/canvas.py',
+                 'widgets/tools/__init__.py', 'widgets/tools/pen.py',
+                 'widgets/data/loose.py', 'scripts/run.py', 'po/messages.py',
+                 '__pycache__/main.py']:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+
+    index = importer.build_index(str(tmp_path))
+
+    assert index['version'] == importer.INDEX_VERSION
+    assert index['modules'] == {
+        'main': ['main.py', False],
+        'setup': ['setup.py', False],
+        'widgets': ['widgets/__init__.py', True],
+        'widgets.canvas': ['widgets/canvas.py', False],
+        'widgets.tools': ['widgets/tools/__init__.py', True],
+        'widgets.tools.pen': ['widgets/tools/pen.py', False],
+    }
@@ -0,0 +1,72 @@
+# test_registry.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+from sugarapp.registry import Registry
+
+
+def _build_registry():
+    registry = Registry()
+    registry.add('org.example.Archive', '/bundles/Archive.activity',
+                 ['application/x-compressed-tar'], ['.tar.gz'])
+    registry.add('org.example.Gzip', '/bundles/Gzip.activity',
+                 ['application/gzip'], ['.gz'])
+    registry.add('org.example.Paint', '/bundles/Paint.activity',
+                 ['image/png'], ['.png'])
+    registry.add('org.example.Viewer', '/bundles/Viewer.activity',
+                 ['image/png'], ['.png'])
+    return registry
+
+
+def test_lookup_filename_longest_suffix():
+    registry = _build_registry()
+
+    assert registry.lookup_filename('backup.tar.gz') == \
+        ('org.example.Archive', '/bundles/Archive.activity')
+    assert registry.lookup_filename('/home/user/my.backup.TAR.GZ') == \
+        ('org.example.Archive', '/bundles/Archive.activity')
+    assert registry.lookup_filename('notes.gz') == \
+        ('org.example.Gzip', '/bundles/Gzip.activity')
+    assert registry.lookup_filename('tar.gz') == \
+        ('org.example.Gzip', '/bundles/Gzip.activity')
+    assert registry.lookup_filename('README') is None
+    assert registry.lookup_filename('notes.txt') is None
+
+
+def test_lookup_preferred_bundle():
+    registry = _build_registry()
+
+    assert registry.lookup_filename('drawing.png')[0] == 'org.example.Paint'
+    assert registry.lookup_filename(
+        'drawing.png', 'org.example.Viewer')[0] == 'org.example.Viewer'
+    assert registry.lookup_mimetype(
+        'image/png', 'org.example.Viewer')[0] == 'org.example.Viewer'
+    assert registry.lookup_mimetype(
+        'image/png', 'org.example.Archive')[0] == 'org.example.Paint'
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    _build_registry().save(path)
+
+    registry = Registry.load(path)
+
+    assert registry.lookup_filename('backup.tar.gz')[0] == \
+        'org.example.Archive'
+    assert len(registry.get_bundles()) == 4
@@ -0,0 +1,46 @@
+# test_validation.py
+#
+# Copyright 2019 Martin Abente Lahaye
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+
+import pytest
+
+from sugarapp.validation import _parse_license
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('MIT', (['MIT'], [])),
+    ('GPL-2.0-only WITH Classpath-exception-2.0',
+     (['GPL-2.0-only'], ['Classpath-exception-2.0'])),
+    ('(MIT OR Apache-2.0) AND GPL-2.0+',
+     (['MIT', 'Apache-2.0', 'GPL-2.0+'], [])),
+    ('((MIT))', (['MIT'], [])),
+    ('LGPL-2.1+ WITH OpenSSL-exception OR (CC0-1.0)',
+     (['LGPL-2.1+', 'CC0-1.0'], ['OpenSSL-exception'])),
+])
+def test_parse_license(expression, expected):
+    assert _parse_license(expression) == expected
+
+
+@pytest.mark.parametrize('expression', [
+    '', 'MIT AND', 'AND MIT', 'MIT WITH', 'MIT WITH (', 'MIT WITH OR',
+    '(MIT', 'MIT)', '()', 'MIT Apache-2.0',
+])
+def test_parse_invalid_license(expression):
+    with pytest.raises(ValueError):
+        _parse_license(expression)